@@ -42,11 +42,25 @@ def eliminar_logs():
 '''
 
 import os
+import queue
+import atexit
+import threading
+import time
 from datetime import datetime
 
 LOG_FILE = "ad_scanner.log"
 LOG_MAX_MB = 5               # Tamaño máximo permitido antes de rotar (en MB)
 LOG_MAX_BACKUPS = 5          # Cantidad de archivos de respaldo
+LOG_FLUSH_SEGUNDOS = 1.0     # Máximo que una línea espera en el buffer antes de llegar al disco
+LOG_VENTANA_REPETIDOS = 600  # Un mensaje idéntico se escribe una vez por ventana, con su cuenta al cerrar
+LOG_LIMITE_POR_CLAVE = 50    # Líneas por 'clave' y por ventana; el resto se cuenta y se resume
+LOG_CLAVES_SIN_LIMITE = ("estado",)  # Registro de auditoría (transiciones): siempre se escriben
+
+# Cola de líneas pendientes: (instante, tipo, mensaje, clave). Un único hilo la vacía al archivo.
+_cola_log = queue.SimpleQueue()
+_FIN = object()
+_hilo_log = None
+_inicio_lock = threading.Lock()
 
 
 def _rotar_logs():
@@ -74,37 +88,187 @@ def _rotar_logs():
         os.rename(LOG_FILE, f"{LOG_FILE}.1")
 
 
-def _excede_tamano_maximo():
+# ------------------------
+# Hilo escritor del log
+# ------------------------
+class _ArchivoLog:
     """
-    Devuelve True si el archivo principal supera LOG_MAX_MB megabytes.
+    Mantiene el archivo abierto y lleva su tamaño en memoria: no hay stat por línea.
+    Sólo lo usa el hilo escritor, así que la rotación no compite con nadie.
     """
-    if not os.path.exists(LOG_FILE):
-        return False
 
-    tamano_bytes = os.path.getsize(LOG_FILE)
-    tamano_mb = tamano_bytes / (1024 * 1024)
+    def __init__(self):
+        self._f = None
+        self._tamano = 0
 
-    return tamano_mb >= LOG_MAX_MB
+    def _abrir(self):
+        self._f = open(LOG_FILE, "a", encoding="utf-8")
+        self._tamano = self._f.tell()
 
+    def escribir(self, linea):
+        if self._f is None:
+            self._abrir()
+        self._f.write(linea)
+        self._tamano += len(linea.encode("utf-8"))
+        if self._tamano >= LOG_MAX_MB * 1024 * 1024:
+            self.cerrar()
+            _rotar_logs()
 
-def escribir_log(mensaje, tipo="INFO"):
+    def flush(self):
+        if self._f is not None:
+            self._f.flush()
+
+    def cerrar(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class _Supresor:
     """
-    Escribe un mensaje al log y rota automáticamente cuando el archivo
-    exceda el tamaño máximo configurado.
+    Colapsa mensajes repetidos y limita las líneas por clave dentro de una ventana.
+    Al cerrar cada ventana devuelve una línea de resumen con lo que se omitió.
     """
-    # Revisar si debe rotarse
-    try:
-        if _excede_tamano_maximo():
-            _rotar_logs()
-    except Exception as e:
-        print(f"[WARN] No se pudo verificar el tamaño del log: {e}")
 
-    # Escribir mensaje
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    linea = f"[{timestamp}] [{tipo}] {mensaje}\n"
+    def __init__(self, ventana=LOG_VENTANA_REPETIDOS, limite=LOG_LIMITE_POR_CLAVE):
+        self._ventana = ventana
+        self._limite = limite
+        self._repetidos = {}   # (tipo, mensaje) -> [vence, repeticiones omitidas]
+        self._claves = {}      # clave -> [vence, escritas, suprimidas]
 
-    try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(linea)
-    except Exception as e:
-        print(f"[ERROR] No se pudo escribir en el log: {e}")
+    def activo(self):
+        return bool(self._repetidos or self._claves)
+
+    def filtrar(self, instante, tipo, mensaje, clave):
+        """
+        True si la línea debe escribirse.
+        """
+        if clave in LOG_CLAVES_SIN_LIMITE:
+            return True
+        if clave is not None:
+            cuenta = self._claves.get(clave)
+            if cuenta is None or instante >= cuenta[0]:
+                cuenta = self._claves[clave] = [instante + self._ventana, 0, 0]
+            if cuenta[1] >= self._limite:
+                cuenta[2] += 1
+                return False
+            cuenta[1] += 1
+
+        repetido = self._repetidos.get((tipo, mensaje))
+        if repetido is not None and instante < repetido[0]:
+            repetido[1] += 1
+            return False
+        self._repetidos[(tipo, mensaje)] = [instante + self._ventana, 0]
+        return True
+
+    def resumenes(self, ahora, todos=False):
+        """
+        Líneas (instante, tipo, mensaje) de resumen de las ventanas vencidas.
+        """
+        minutos = max(1, round(self._ventana / 60))
+        lineas = []
+
+        for (tipo, mensaje), (vence, omitidas) in list(self._repetidos.items()):
+            if todos or ahora >= vence:
+                del self._repetidos[(tipo, mensaje)]
+                if omitidas:
+                    lineas.append((ahora, tipo, f"{mensaje} (repetido {omitidas} veces en los últimos {minutos} min)"))
+
+        for clave, (vence, _, suprimidas) in list(self._claves.items()):
+            if todos or ahora >= vence:
+                del self._claves[clave]
+                if suprimidas:
+                    lineas.append((ahora, "INFO", f"{suprimidas} mensajes '{clave}' omitidos en los últimos "
+                                                  f"{minutos} min (límite {self._limite})"))
+        return lineas
+
+
+def _formatear(instante, tipo, mensaje):
+    timestamp = datetime.fromtimestamp(instante).strftime("%Y-%m-%d %H:%M:%S")
+    return f"[{timestamp}] [{tipo}] {mensaje}\n"
+
+
+def _bucle_log():
+    archivo = _ArchivoLog()
+    supresor = _Supresor()
+    pendiente_flush = False
+    ultimo_flush = time.time()
+    proxima_revision = 0.0
+
+    while True:
+        try:
+            if pendiente_flush:
+                # Se espera sólo lo que falta para el próximo flush, aunque sigan llegando líneas
+                item = _cola_log.get(timeout=max(0.0, ultimo_flush + LOG_FLUSH_SEGUNDOS - time.time()))
+            else:
+                item = _cola_log.get(timeout=LOG_FLUSH_SEGUNDOS if supresor.activo() else None)
+        except queue.Empty:
+            item = None
+
+        try:
+            ahora = time.time()
+            if item is _FIN or ahora >= proxima_revision:
+                # Resúmenes de ventanas cerradas (al cerrar, de todas)
+                for resumen in supresor.resumenes(ahora, todos=item is _FIN):
+                    archivo.escribir(_formatear(*resumen))
+                    pendiente_flush = True
+                proxima_revision = ahora + LOG_FLUSH_SEGUNDOS
+
+            if item is not None and item is not _FIN:
+                instante, tipo, mensaje, clave = item
+                if supresor.filtrar(instante, tipo, mensaje, clave):
+                    archivo.escribir(_formatear(instante, tipo, mensaje))
+                    pendiente_flush = True
+
+            # El buffer baja al disco con la cola vacía, al cerrar o cuando pasó
+            # LOG_FLUSH_SEGUNDOS desde el último flush (con log constante la cola nunca se vacía)
+            if item is None or item is _FIN or (pendiente_flush and ahora - ultimo_flush >= LOG_FLUSH_SEGUNDOS):
+                archivo.flush()
+                pendiente_flush = False
+                ultimo_flush = ahora
+                if item is _FIN:
+                    archivo.cerrar()
+                    return
+
+        except Exception as e:
+            print(f"[ERROR] No se pudo escribir en el log: {e}")
+            try:
+                archivo.cerrar()
+            except Exception:
+                pass
+
+
+def _iniciar_hilo_log():
+    global _hilo_log
+    with _inicio_lock:
+        if _hilo_log is None:
+            _hilo_log = threading.Thread(target=_bucle_log, name="EscritorLog", daemon=True)
+            _hilo_log.start()
+            atexit.register(cerrar_log)
+
+
+def cerrar_log(timeout=5):
+    """
+    Escribe lo que quede en la cola, cierra el archivo y termina el hilo escritor.
+    Se llama sola al salir del proceso.
+    """
+    global _hilo_log
+    with _inicio_lock:
+        hilo, _hilo_log = _hilo_log, None
+    if hilo is not None:
+        _cola_log.put(_FIN)
+        hilo.join(timeout)
+
+
+def escribir_log(mensaje, tipo="INFO", clave=None):
+    """
+    Encola un mensaje para el log. La escritura, el buffer y la rotación
+    (cuando el archivo excede LOG_MAX_MB) quedan a cargo de un único hilo.
+    Un mensaje idéntico se escribe una vez cada LOG_VENTANA_REPETIDOS segundos
+    y al final de la ventana se agrega cuántas veces se repitió. Con 'clave'
+    (p. ej. "ping") además se limita a LOG_LIMITE_POR_CLAVE líneas por ventana.
+    Las claves de LOG_CLAVES_SIN_LIMITE (transiciones de estado) no se omiten nunca.
+    """
+    if _hilo_log is None:
+        _iniciar_hilo_log()
+    _cola_log.put((time.time(), tipo, mensaje, clave))
@@ -176,11 +176,13 @@ def enviar_alertas_inactividad(conn):
 '''
 
 import json
-import requests
+import gzip
 from datetime import datetime, timedelta
 import jwt  # pip install PyJWT
-from Datos.db_conexion_extras import ejecutar_sql_reintento, ejecutar_sql_fetch
+from Datos.db_conexion_extras import ejecutar_sql_reintento, ejecutar_sql_fetch, ejecutar_sql_lote
 from Datos.db_conexion import ejecutar_sql
+from Configs.webhook_envio import EnviadorWebhook, WEBHOOK_MAX_POR_DESTINO, WEBHOOK_ESPERA_CICLO
+from Modulos.metricas import contar
 
 import os
 from cryptography.fernet import Fernet
@@ -188,6 +190,9 @@ from cryptography.fernet import Fernet
 WEBHOOK_CONFIG_PATH = "Configs/personal_info/webhook_config.json"
 KEY_FILE = "secret.key"
 
+LOTE_MAX_EQUIPOS = 100        # Modo lote: equipos por POST
+LOTE_MAX_BYTES = 256 * 1024   # Modo lote: tamaño máximo del JSON (antes de comprimir)
+
 
 # ----------------------------------------------------
 # ENCRIPTACIÓN / DESENCRIPTACIÓN SOLO PARA SECRET
@@ -228,9 +233,14 @@ def decrypt_value(value):
 def cargar_webhook_config():
     """
     Devuelve dict con keys:
-      { "webhook_url": str or None, "min_seconds_inactivo": int, "webhook_secret": str or None }
+      { "webhook_url": str or None, "min_seconds_inactivo": int, "webhook_secret": str or None,
+        "max_por_destino": int, "espera_envio": int,
+        "modo_lote": bool, "lote_max_equipos": int, "lote_max_bytes": int, "gzip": bool }
     """
-    default = {"webhook_url": None, "min_seconds_inactivo": 60, "webhook_secret": None}
+    default = {"webhook_url": None, "min_seconds_inactivo": 60, "webhook_secret": None,
+               "max_por_destino": WEBHOOK_MAX_POR_DESTINO, "espera_envio": WEBHOOK_ESPERA_CICLO,
+               "modo_lote": False, "lote_max_equipos": LOTE_MAX_EQUIPOS,
+               "lote_max_bytes": LOTE_MAX_BYTES, "gzip": False}
 
     try:
         with open(WEBHOOK_CONFIG_PATH, "r", encoding="utf-8") as f:
@@ -248,10 +258,28 @@ def cargar_webhook_config():
         except Exception:
             min_sec = 60
 
+        try:
+            max_por_destino = max(1, int(data.get("max_por_destino", WEBHOOK_MAX_POR_DESTINO)))
+            espera_envio = max(1, int(data.get("espera_envio", WEBHOOK_ESPERA_CICLO)))
+        except Exception:
+            max_por_destino, espera_envio = WEBHOOK_MAX_POR_DESTINO, WEBHOOK_ESPERA_CICLO
+
+        try:
+            lote_max_equipos = max(1, int(data.get("lote_max_equipos", LOTE_MAX_EQUIPOS)))
+            lote_max_bytes = max(1024, int(data.get("lote_max_bytes", LOTE_MAX_BYTES)))
+        except Exception:
+            lote_max_equipos, lote_max_bytes = LOTE_MAX_EQUIPOS, LOTE_MAX_BYTES
+
         return {
             "webhook_url": url,
             "min_seconds_inactivo": min_sec,
             "webhook_secret": secret,
+            "max_por_destino": max_por_destino,
+            "espera_envio": espera_envio,
+            "modo_lote": bool(data.get("modo_lote", False)),
+            "lote_max_equipos": lote_max_equipos,
+            "lote_max_bytes": lote_max_bytes,
+            "gzip": bool(data.get("gzip", False)),
         }
 
     except FileNotFoundError:
@@ -313,109 +341,338 @@ def generar_jwt(secret, expiracion_segundos=3600):
 '''
 
 # ----------------------------------------------------
-# ENVIAR ALERTAS DE INACTIVIDAD
+# TABLAS E ÍNDICES DE ALERTAS (una vez por proceso)
 # ----------------------------------------------------
-def enviar_alertas_inactividad(conn):
-    cfg = cargar_webhook_config()
-    webhook_url = cfg["webhook_url"]
-    min_seconds = cfg["min_seconds_inactivo"]
-    secret = cfg.get("webhook_secret")
+_tablas_alertas_listas = False
 
-    if not webhook_url:
-        print("[ALERTAS] No hay URL configurada. Saltando ciclo.")
+
+def preparar_tablas_alertas(conn):
+    """
+    Crea AlertasEnviadas y su índice si no existen. Sólo consulta la base
+    la primera vez que se llama en el proceso.
+    """
+    global _tablas_alertas_listas
+    if _tablas_alertas_listas:
         return
 
-    # Crear tabla AlertasEnviadas si no existe
     crear_tabla_alertas = """
         IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='AlertasEnviadas' AND xtype='U')
         CREATE TABLE AlertasEnviadas (
             Nombre NVARCHAR(255),
             Fecha DATE
-        )
+        );
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='IX_AlertasEnviadas_Nombre_Fecha')
+        CREATE INDEX IX_AlertasEnviadas_Nombre_Fecha ON AlertasEnviadas (Nombre, Fecha);
+
+        -- Bandeja de salida: alertas pendientes de entrega (modo WEBHOOK_OUTBOX)
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='AlertasOutbox' AND xtype='U')
+        CREATE TABLE AlertasOutbox (
+            Id INT IDENTITY(1,1) PRIMARY KEY,
+            Nombre NVARCHAR(255) NOT NULL,
+            Fecha DATE NOT NULL,
+            Payload NVARCHAR(MAX) NOT NULL,
+            Estado NVARCHAR(20) NOT NULL DEFAULT 'pendiente',
+            Intentos INT NOT NULL DEFAULT 0,
+            ProximoIntento DATETIME NOT NULL,
+            UltimoError NVARCHAR(500) NULL,
+            CreadaEl DATETIME NOT NULL DEFAULT GETDATE(),
+            EnviadaEl DATETIME NULL
+        );
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='IX_AlertasOutbox_Nombre_Fecha')
+        CREATE INDEX IX_AlertasOutbox_Nombre_Fecha ON AlertasOutbox (Nombre, Fecha);
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='IX_AlertasOutbox_Pendientes')
+        CREATE INDEX IX_AlertasOutbox_Pendientes ON AlertasOutbox (ProximoIntento)
+            WHERE Estado = 'pendiente';
     """
-    ejecutar_sql_reintento(conn, crear_tabla_alertas, ())
+    if ejecutar_sql_reintento(conn, crear_tabla_alertas, ()):
+        _tablas_alertas_listas = True
 
-    # Buscar equipos inactivos
-    query_inactivos = """
-        SELECT Nombre, IP, InactivoDesde, Descripcion, Responsable, Ubicacion
-        FROM EquiposAD
-        WHERE InactivoDesde IS NOT NULL
+
+# ----------------------------------------------------
+# CANDIDATOS A ALERTA (una sola consulta)
+# ----------------------------------------------------
+QUERY_CANDIDATOS = """
+    SELECT e.Nombre, e.IP, e.InactivoDesde, e.Descripcion, e.Responsable, e.Ubicacion
+    FROM EquiposAD AS e
+    WHERE e.InactivoDesde IS NOT NULL
+      AND e.InactivoDesde <= ?
+      AND (e.EstadoAD IS NULL OR e.EstadoAD <> 'Removido de AD')
+      AND NOT EXISTS (
+          SELECT 1 FROM AlertasEnviadas AS a
+          WHERE a.Nombre = e.Nombre AND a.Fecha = ?
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM AlertasOutbox AS o
+          WHERE o.Nombre = e.Nombre AND o.Fecha = ?
+      )
+"""
+
+
+def _a_datetime(valor):
     """
-    inactivos = ejecutar_sql_fetch(conn, query_inactivos)
+    InactivoDesde puede venir como datetime o como texto según el driver.
+    """
+    if isinstance(valor, str):
+        try:
+            return datetime.fromisoformat(valor)
+        except Exception:
+            return datetime.strptime(valor, "%Y-%m-%d %H:%M:%S")
+    return valor
 
-    if not inactivos:
-        print("[ALERTAS] Ningún equipo está inactivo.")
-        return
 
-    ahora = datetime.now()
-    hoy = ahora.date()
+def obtener_candidatos_alerta(conn, min_seconds, ahora=None):
+    """
+    Devuelve los equipos que superan min_seconds de inactividad y todavía no
+    tienen alerta hoy (ni enviada ni en la bandeja de salida). El umbral y los
+    anti-join se evalúan en SQL; la hora de referencia es la de este proceso,
+    igual que la que se guarda en InactivoDesde.
+    """
+    ahora = ahora or datetime.now()
+    limite = ahora - timedelta(seconds=min_seconds)
+    return ejecutar_sql_fetch(conn, QUERY_CANDIDATOS, params=(limite, ahora.date(), ahora.date()))
 
-    for row in inactivos:
-        nombre, ip, inactivo_desde, descripcion, responsable, ubicacion = row
 
-        if not inactivo_desde:
-            continue
+def registrar_alertas_enviadas(conn, nombres, hoy):
+    """
+    Registra de una vez las alertas enviadas y actualiza UltimoWebhook.
+    Devuelve True si ambas escrituras quedaron hechas.
+    """
+    if not nombres:
+        return True
+    filas = [(nombre,) for nombre in nombres]
+    registradas = ejecutar_sql_lote(conn, "INSERT INTO AlertasEnviadas (Nombre, Fecha) VALUES (?, ?)",
+                                    [(nombre, hoy) for nombre in nombres])
+    if not registradas:
+        print(f"[ERROR ALERTAS] No se pudieron registrar {len(nombres)} alertas enviadas: "
+              "podrían repetirse en el próximo ciclo.")
 
-        # Convertir si viene como string
-        if isinstance(inactivo_desde, str):
-            try:
-                inactivo_desde = datetime.fromisoformat(inactivo_desde)
-            except Exception:
-                try:
-                    inactivo_desde = datetime.strptime(inactivo_desde, "%Y-%m-%d %H:%M:%S")
-                except Exception:
-                    print(f"[ALERTAS] No pude parsear InactivoDesde para {nombre}: {inactivo_desde}")
-                    continue
+    actualizadas = ejecutar_sql_lote(conn, "UPDATE EquiposAD SET UltimoWebhook = GETDATE() WHERE Nombre = ?", filas)
+    if not actualizadas:
+        print(f"[ERROR ALERTAS] No se pudo actualizar UltimoWebhook de {len(nombres)} equipos.")
 
-        # Ver tiempo inactivo
-        diff = ahora - inactivo_desde
-        segundos_inactivo = diff.total_seconds()
+    return registradas and actualizadas
 
-        if segundos_inactivo < min_seconds:
-            print(f"[ALERTAS] {nombre} inactivo {int(segundos_inactivo)}s < {min_seconds}s → se salta")
+
+def armar_payload(row, ahora):
+    """
+    Payload de la alerta para una fila de candidatos. Devuelve None si
+    InactivoDesde no se puede interpretar.
+    """
+    nombre, ip, inactivo_desde, descripcion, responsable, ubicacion = row
+
+    try:
+        inactivo_desde = _a_datetime(inactivo_desde)
+    except Exception:
+        print(f"[ALERTAS] No pude parsear InactivoDesde para {nombre}: {inactivo_desde}")
+        return None
+
+    segundos_inactivo = (ahora - inactivo_desde).total_seconds()
+
+    return {
+        "servidor": nombre,
+        "ip": ip,
+        "descripcion": descripcion,
+        "responsable": responsable,
+        "ubicacion": ubicacion,
+        "inactivo_desde": inactivo_desde.isoformat(),
+        "segundos_inactivo": int(segundos_inactivo)
+    }
+
+
+def encolar_alertas(conn, candidatos, ahora, lanzar=False):
+    """
+    Guarda las alertas en AlertasOutbox para que las entregue el TrabajadorOutbox.
+    Devuelve los nombres encolados ([] si falla, o el error con lanzar=True).
+    """
+    filas = []
+    for row in candidatos:
+        payload = armar_payload(row, ahora)
+        if payload is not None:
+            filas.append((row[0], ahora.date(), json.dumps(payload), ahora))
+
+    if filas and not ejecutar_sql_lote(
+        conn,
+        "INSERT INTO AlertasOutbox (Nombre, Fecha, Payload, ProximoIntento) VALUES (?, ?, ?, ?)",
+        filas
+    ):
+        if lanzar:
+            raise RuntimeError(f"no se pudieron encolar {len(filas)} alertas")
+        return []
+    return [fila[0] for fila in filas]
+
+
+# ----------------------------------------------------
+# LOTES (varios equipos por POST)
+# ----------------------------------------------------
+def armar_lotes(payloads, max_equipos=LOTE_MAX_EQUIPOS, max_bytes=LOTE_MAX_BYTES, comprimir=False, claves=None):
+    """
+    Agrupa los payloads en cuerpos {"alertas": [...], "total": n} de hasta
+    max_equipos y max_bytes. Devuelve [(tupla de claves, cuerpo bytes)]; las claves
+    son los nombres o, si se pasa 'claves' (alineada con payloads), esos valores.
+    Un payload que por sí solo supera max_bytes va en un lote propio.
+    """
+    lotes = []
+    nombres, items, tamano = [], [], 0
+    if claves is None:
+        claves = [payload["servidor"] for payload in payloads]
+
+    def cerrar_lote():
+        cuerpo = b'{"alertas":[' + b",".join(items) + b'],"total":' + str(len(items)).encode() + b"}"
+        lotes.append((tuple(nombres), gzip.compress(cuerpo) if comprimir else cuerpo))
+
+    for payload, clave in zip(payloads, claves):
+        item = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        if items and (len(items) >= max_equipos or tamano + len(item) + 1 > max_bytes):
+            cerrar_lote()
+            nombres, items, tamano = [], [], 0
+        nombres.append(clave)
+        items.append(item)
+        tamano += len(item) + 1
+
+    if items:
+        cerrar_lote()
+    return lotes
+
+
+def armar_envios(payloads, cfg, claves=None):
+    """
+    Envíos (clave, url, payload, headers) para EnviadorWebhook.enviar_todos:
+    con cfg["modo_lote"] un POST por lote (clave = tupla), si no uno por equipo.
+    Lo usan el envío directo y el TrabajadorOutbox.
+    """
+    webhook_url = cfg["webhook_url"]
+    secret = cfg.get("webhook_secret")
+    if claves is None:
+        claves = [payload["servidor"] for payload in payloads]
+
+    envios = []
+    if cfg["modo_lote"]:
+        for claves_lote, cuerpo in armar_lotes(payloads, cfg["lote_max_equipos"], cfg["lote_max_bytes"],
+                                               cfg["gzip"], claves):
+            headers = {"Content-Type": "application/json"}
+            if cfg["gzip"]:
+                headers["Content-Encoding"] = "gzip"
+            if secret:
+                headers["Authorization"] = f"Bearer {generar_jwt(secret)}"
+            envios.append((claves_lote, webhook_url, cuerpo, headers))
+    else:
+        for clave, payload in zip(claves, payloads):
+            headers = {}
+            if secret:
+                headers["Authorization"] = f"Bearer {generar_jwt(secret)}"
+            envios.append((clave, webhook_url, payload, headers))
+    return envios
+
+
+# ----------------------------------------------------
+# ENVIADOR COMPARTIDO (sesión HTTP + pools por destino)
+# ----------------------------------------------------
+_enviador = None
+
+
+def obtener_enviador(cfg):
+    global _enviador
+    if _enviador is None:
+        _enviador = EnviadorWebhook(max_por_destino=cfg["max_por_destino"])
+    return _enviador
+
+
+def _procesar_resultados(resultados):
+    """
+    Imprime el resultado de cada envío y devuelve los nombres con respuesta 200.
+    En modo lote la clave es la tupla de nombres y el resultado vale para todos.
+    """
+    enviados = []
+    for clave, resultado in resultados.items():
+        nombres = clave if isinstance(clave, tuple) else (clave,)
+        nombre = nombres[0] if len(nombres) == 1 else f"lote de {len(nombres)} equipos ({nombres[0]}, ...)"
+
+        if isinstance(resultado, Exception):
+            contar("webhook_error", len(nombres))
+            print(f"[ERROR ALERTA] No se pudo enviar a {nombre}: {resultado}")
+            print("[ALERTAS] Se reintentará en el próximo ciclo.")
             continue
 
-        # Evitar alertas duplicadas en el mismo día
-        query_verificar = "SELECT 1 FROM AlertasEnviadas WHERE Nombre = ? AND Fecha = ?"
-        ya = ejecutar_sql_fetch(conn, query_verificar, params=(nombre, hoy))
-        if ya:
+        print(f"[ALERTA] Enviada → {nombre} → {resultado}")
+        if resultado == 200:
+            enviados.extend(nombres)
+        contar("webhook_ok" if resultado == 200 else "webhook_error", len(nombres))
+    return enviados
+
+
+# ----------------------------------------------------
+# ENTREGAR ALERTAS (envío directo o bandeja de salida)
+# ----------------------------------------------------
+def entregar_alertas(conn, candidatos, cfg, ahora, outbox=None, lanzar=False):
+    """
+    Envía las alertas de 'candidatos' (filas Nombre, IP, InactivoDesde, Descripcion,
+    Responsable, Ubicacion) y registra las entregadas. Con 'outbox' sólo las encola
+    (el TrabajadorOutbox aplica modo_lote y gzip al entregarlas).
+    Devuelve los nombres entregados o encolados, incluidos envíos anteriores que
+    respondieron tarde. Con lanzar=True un fallo al encolar o registrar lanza
+    RuntimeError (para quien reconecta al fallar).
+    """
+    if outbox is not None:
+        encoladas = encolar_alertas(conn, candidatos, ahora, lanzar)
+        if encoladas:
+            print(f"[ALERTAS] {len(encoladas)} alertas encoladas para envío.")
+            outbox.avisar()
+        return encoladas
+
+    enviador = obtener_enviador(cfg)
+
+    # Envíos anteriores que respondieron después de la espera
+    enviados = _procesar_resultados(enviador.tomar_tardios())
+
+    payloads = []
+
+    for row in candidatos:
+        nombre = row[0]
+
+        if nombre in enviados or enviador.en_curso(nombre):
             continue
 
         # Payload a enviar
-        payload = {
-            "servidor": nombre,
-            "ip": ip,
-            "descripcion": descripcion,
-            "responsable": responsable,
-            "ubicacion": ubicacion,
-            "inactivo_desde": inactivo_desde.isoformat(),
-            "segundos_inactivo": int(segundos_inactivo)
-        }
+        payload = armar_payload(row, ahora)
+        if payload is not None:
+            payloads.append(payload)
 
-        headers = {}
-        if secret:
-            headers["Authorization"] = f"Bearer {generar_jwt(secret)}"
+    envios = armar_envios(payloads, cfg)
 
-        # -----------------------------------------------
-        # ENVÍO DE ALERTA
-        # -----------------------------------------------
-        try:
-            resp = requests.post(webhook_url, json=payload, headers=headers, timeout=8)
-            print(f"[ALERTA] Enviada → {nombre} → {resp.status_code}")
+    # -----------------------------------------------
+    # ENVÍO DE ALERTAS (en paralelo, con espera acotada)
+    # -----------------------------------------------
+    if envios:
+        enviados += _procesar_resultados(enviador.enviar_todos(envios, espera=cfg["espera_envio"]))
 
-            if resp.status_code == 200:
-                # Registrar que se envió hoy
-                query_insert = "INSERT INTO AlertasEnviadas (Nombre, Fecha) VALUES (?, ?)"
-                ejecutar_sql_reintento(conn, query_insert, params=(nombre, hoy))
+    # Registrar todas las alertas entregadas (AlertasEnviadas + UltimoWebhook)
+    if not registrar_alertas_enviadas(conn, enviados, ahora.date()) and lanzar:
+        raise RuntimeError(f"no se pudieron registrar {len(enviados)} alertas enviadas")
+    return enviados
 
-                # 🔥 Actualizar UltimoWebhook
-                query_update_webhook = """
-                    UPDATE EquiposAD
-                    SET UltimoWebhook = GETDATE()
-                    WHERE Nombre = ?
-                """
-                ejecutar_sql_reintento(conn, query_update_webhook, params=(nombre,))
 
-        except Exception as e:
-            print(f"[ERROR ALERTA] No se pudo enviar a {nombre}: {e}")
-            print("[ALERTAS] Se reintentará en el próximo ciclo.")
+# ----------------------------------------------------
+# ENVIAR ALERTAS DE INACTIVIDAD
+# ----------------------------------------------------
+def enviar_alertas_inactividad(conn, outbox=None):
+    """
+    Busca los equipos a alertar. Con 'outbox' (TrabajadorOutbox) sólo los encola
+    y la entrega corre en segundo plano; sin él los envía en este ciclo.
+    """
+    cfg = cargar_webhook_config()
+
+    if not cfg["webhook_url"]:
+        print("[ALERTAS] No hay URL configurada. Saltando ciclo.")
+        return
+
+    preparar_tablas_alertas(conn)
+
+    ahora = datetime.now()
+
+    # Equipos inactivos por encima del umbral y sin alerta hoy
+    candidatos = obtener_candidatos_alerta(conn, cfg["min_seconds_inactivo"], ahora)
+
+    if not candidatos:
+        print("[ALERTAS] Ningún equipo pendiente de alerta.")
+
+    entregar_alertas(conn, candidatos, cfg, ahora, outbox)
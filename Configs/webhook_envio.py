@@ -0,0 +1,117 @@
+# ---------------------------------------
+# Archivo: Configs/webhook_envio.py
+# Envío concurrente de webhooks con sesión HTTP compartida (keep-alive)
+# ---------------------------------------
+
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+
+WEBHOOK_MAX_POR_DESTINO = 4    # Envíos simultáneos hacia un mismo host receptor
+WEBHOOK_TIMEOUT = (3, 8)       # (conexión, lectura) en segundos
+WEBHOOK_ESPERA_CICLO = 20      # Máximo que el ciclo espera los envíos antes de seguir
+
+
+class EnviadorWebhook:
+    """
+    Reutiliza una requests.Session (conexiones TLS abiertas entre envíos) y manda
+    en paralelo. Cada host receptor tiene su propio pool de hilos acotado, así un
+    receptor lento sólo ocupa sus hilos y no frena al resto ni al ciclo de escaneo.
+    """
+
+    def __init__(self, max_por_destino=WEBHOOK_MAX_POR_DESTINO, timeout=WEBHOOK_TIMEOUT):
+        self._max_por_destino = max_por_destino
+        self._timeout = timeout
+        self._sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=8, pool_maxsize=max_por_destino, max_retries=0)
+        self._sesion.mount("https://", adaptador)
+        self._sesion.mount("http://", adaptador)
+
+        self._pools = {}          # host receptor -> ThreadPoolExecutor
+        self._en_curso = set()    # claves con un envío todavía sin respuesta
+        self._tardios = {}        # clave -> resultado de envíos que terminaron tras la espera
+        self._lock = threading.Lock()
+
+    def _pool(self, url):
+        destino = urlsplit(url).netloc.lower()
+        with self._lock:
+            pool = self._pools.get(destino)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=self._max_por_destino,
+                                          thread_name_prefix=f"Webhook-{destino}")
+                self._pools[destino] = pool
+            return pool
+
+    def _post(self, url, payload, headers):
+        # payload en bytes = cuerpo ya serializado (lotes, posiblemente comprimidos)
+        if isinstance(payload, bytes):
+            resp = self._sesion.post(url, data=payload, headers=headers, timeout=self._timeout)
+        else:
+            resp = self._sesion.post(url, json=payload, headers=headers, timeout=self._timeout)
+        return resp.status_code
+
+    @staticmethod
+    def _claves(clave):
+        # Un envío por lote usa como clave la tupla de nombres: cada uno cuenta como en vuelo
+        return (clave,) + clave if isinstance(clave, tuple) else (clave,)
+
+    def en_curso(self, clave):
+        with self._lock:
+            return clave in self._en_curso
+
+    def enviar_todos(self, envios, espera=WEBHOOK_ESPERA_CICLO):
+        """
+        envios: iterable de (clave, url, payload, headers); payload es un dict (JSON)
+        o bytes con el cuerpo ya armado.
+        Devuelve {clave: status_code o excepción} de lo que respondió dentro de 'espera'.
+        Lo que siga en vuelo termina en segundo plano y se entrega con tomar_tardios().
+        """
+        futuros = {}
+        for clave, url, payload, headers in envios:
+            claves = self._claves(clave)
+            with self._lock:
+                if self._en_curso.intersection(claves):
+                    continue
+                self._en_curso.update(claves)
+            futuros[self._pool(url).submit(self._post, url, payload, headers)] = clave
+
+        hechos, pendientes = wait(futuros, timeout=espera)
+
+        resultados = {}
+        for futuro in hechos:
+            resultados[futuros[futuro]] = self._resultado(futuro)
+            with self._lock:
+                self._en_curso.difference_update(self._claves(futuros[futuro]))
+
+        for futuro in pendientes:
+            futuro.add_done_callback(lambda f, clave=futuros[futuro]: self._terminar_tardio(clave, f))
+        return resultados
+
+    @staticmethod
+    def _resultado(futuro):
+        try:
+            return futuro.result()
+        except Exception as e:
+            return e
+
+    def _terminar_tardio(self, clave, futuro):
+        with self._lock:
+            self._tardios[clave] = self._resultado(futuro)
+            self._en_curso.difference_update(self._claves(clave))
+
+    def tomar_tardios(self):
+        """
+        Devuelve (y olvida) los resultados que llegaron después de la espera del ciclo.
+        """
+        with self._lock:
+            tardios, self._tardios = self._tardios, {}
+        return tardios
+
+    def cerrar(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=True)
+        self._sesion.close()
@@ -0,0 +1,206 @@
+# ---------------------------------------
+# Archivo: Configs/webhook_eventos.py
+# Alertas de inactividad disparadas por temporizadores en memoria
+# ---------------------------------------
+
+import heapq
+import threading
+import time
+from datetime import date, datetime, timedelta
+from Datos.db_conexion import conectar_sql
+from Datos.db_conexion_extras import ejecutar_sql_fetch
+from Configs.webhook_alerts import cargar_webhook_config, preparar_tablas_alertas, entregar_alertas
+from Configs.logs_utils import escribir_log
+
+EVENTOS_REINTENTO = 60        # Segundos hasta reintentar una alerta que no se pudo entregar
+EVENTOS_RELEER_CONFIG = 30    # Cada cuánto se relee webhook_config.json (umbral, URL)
+
+
+def _inicio_manana():
+    return datetime.combine(date.today() + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+class ProgramadorAlertas:
+    """
+    Recibe de procesar_equipo las transiciones a inactivo y programa un temporizador
+    para cuando el equipo supere min_seconds_inactivo; si vuelve a responder antes,
+    el temporizador se cancela. La alerta sale al vencer el temporizador, sin
+    recorrer EquiposAD en cada ciclo ni esperar a que el ciclo termine.
+    """
+
+    def __init__(self, config, outbox=None):
+        self._config = config
+        self._outbox = outbox
+        self._cond = threading.Condition()
+        self._heap = []           # (vence epoch, nombre, versión)
+        self._inactivos = {}      # nombre -> (versión, fila de candidato)
+        self._version = 0
+        self._alertados = {}      # nombre -> fecha de la última alerta entregada/encolada
+        self._cfg = cargar_webhook_config()
+        self._detener = False
+        self._hilo = threading.Thread(target=self._bucle, name="AlertasEventos", daemon=True)
+
+        self.disparadas = 0
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self, timeout=10):
+        with self._cond:
+            self._detener = True
+            self._cond.notify()
+        self._hilo.join(timeout)
+
+    def pendientes(self):
+        with self._cond:
+            return len(self._inactivos)
+
+    # ------------------------
+    # Transiciones (hilos de ping)
+    # ------------------------
+    def marcar_inactivo(self, eq, inactivo_desde):
+        """
+        El equipo pasó a inactivo en 'inactivo_desde': se arma su temporizador.
+        """
+        fila = (eq["nombre"], eq["ip"], inactivo_desde, eq["descripcion"], eq["responsable"], eq["ubicacion"])
+        with self._cond:
+            self._version += 1
+            self._inactivos[eq["nombre"]] = (self._version, fila)
+            vence = inactivo_desde.timestamp() + self._cfg["min_seconds_inactivo"]
+            heapq.heappush(self._heap, (vence, eq["nombre"], self._version))
+            if self._heap[0][2] == self._version:
+                self._cond.notify()
+
+    def marcar_activo(self, nombre):
+        """
+        El equipo volvió a responder: su temporizador queda cancelado.
+        """
+        with self._cond:
+            self._inactivos.pop(nombre, None)  # La entrada del heap se descarta al vencer
+
+    def cancelar(self, nombres):
+        """
+        Cancela los temporizadores de equipos que dejaron de venir de AD
+        (desalojados del estado en memoria), aunque la reconciliación esté apagada.
+        """
+        with self._cond:
+            for nombre in nombres:
+                self._inactivos.pop(nombre, None)
+
+    # ------------------------
+    # Hilo de temporizadores
+    # ------------------------
+    def _reprogramar(self):
+        self._heap = [(fila[2].timestamp() + self._cfg["min_seconds_inactivo"], nombre, version)
+                      for nombre, (version, fila) in self._inactivos.items()]
+        heapq.heapify(self._heap)
+
+    def _tomar_vencidos(self, ahora):
+        hoy = date.today()
+        vencidos = []
+        tomados = set()
+        while self._heap and self._heap[0][0] <= ahora:
+            _, nombre, version = heapq.heappop(self._heap)
+            actual = self._inactivos.get(nombre)
+            if actual is None or actual[0] != version or nombre in tomados:
+                continue  # Cancelado, reemplazado por una transición más nueva o repetido
+            if self._alertados.get(nombre) == hoy:
+                # Una alerta por equipo y por día, como AlertasEnviadas: si sigue caído, mañana otra
+                heapq.heappush(self._heap, (_inicio_manana(), nombre, version))
+                continue
+            vencidos.append(actual[1])
+            tomados.add(nombre)
+        return vencidos
+
+    def _releer_config(self):
+        cfg = cargar_webhook_config()
+        hoy = date.today()
+        with self._cond:
+            cambio_umbral = cfg["min_seconds_inactivo"] != self._cfg["min_seconds_inactivo"]
+            self._cfg = cfg
+            if cambio_umbral:
+                self._reprogramar()
+            self._alertados = {n: f for n, f in self._alertados.items() if f == hoy}
+
+    def _cargar_alertados_hoy(self, conn):
+        hoy = date.today()
+        filas = ejecutar_sql_fetch(conn, """
+            SELECT Nombre FROM AlertasEnviadas WHERE Fecha = ?
+            UNION
+            SELECT Nombre FROM AlertasOutbox WHERE Fecha = ?
+        """, params=(hoy, hoy))
+        with self._cond:
+            for (nombre,) in filas:
+                self._alertados[nombre] = hoy
+
+    def _disparar(self, conn, vencidos):
+        cfg = self._cfg
+        entregados = set()
+        if cfg["webhook_url"]:
+            # lanzar=True: si no se pudo encolar/registrar, _bucle reconecta y reprograma
+            entregados = set(entregar_alertas(conn, vencidos, cfg, datetime.now(), self._outbox, lanzar=True))
+        else:
+            print("[ALERTAS] No hay URL configurada. Se reintentará más tarde.")
+
+        hoy = date.today()
+        manana = _inicio_manana()
+        with self._cond:
+            for nombre in entregados:
+                self._alertados[nombre] = hoy
+                # Sigue programado: si continúa inactivo, vuelve a alertar al día siguiente
+                actual = self._inactivos.get(nombre)
+                if actual is not None:
+                    heapq.heappush(self._heap, (manana, nombre, actual[0]))
+        self._reintentar([fila for fila in vencidos if fila[0] not in entregados])
+        self.disparadas += len(entregados)
+
+    def _reintentar(self, filas):
+        """
+        Vuelve a programar en EVENTOS_REINTENTO segundos las alertas no entregadas
+        cuyo equipo sigue inactivo desde la misma transición.
+        """
+        reintento = time.time() + EVENTOS_REINTENTO
+        with self._cond:
+            for fila in filas:
+                actual = self._inactivos.get(fila[0])
+                if actual is not None and actual[1] is fila:
+                    heapq.heappush(self._heap, (reintento, fila[0], actual[0]))
+
+    def _bucle(self):
+        conn = conectar_sql(self._config)
+        preparar_tablas_alertas(conn)
+        self._cargar_alertados_hoy(conn)
+        proxima_config = time.time() + EVENTOS_RELEER_CONFIG
+
+        while True:
+            with self._cond:
+                while not self._detener:
+                    ahora = time.time()
+                    limite = min(proxima_config, self._heap[0][0] if self._heap else proxima_config)
+                    if limite <= ahora:
+                        break
+                    self._cond.wait(limite - ahora)
+                if self._detener:
+                    break
+                vencidos = self._tomar_vencidos(time.time())
+
+            try:
+                if time.time() >= proxima_config:
+                    self._releer_config()
+                    proxima_config = time.time() + EVENTOS_RELEER_CONFIG
+                if vencidos:
+                    self._disparar(conn, vencidos)
+            except Exception as e:
+                escribir_log(f"Alertas por eventos: error al disparar, reconectando: {e}", tipo="ERROR")
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = conectar_sql(self._config)
+                self._reintentar(vencidos)
+
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,170 @@
+# ---------------------------------------
+# Archivo: Configs/webhook_outbox.py
+# Entrega en segundo plano de las alertas encoladas en AlertasOutbox
+# ---------------------------------------
+
+import json
+import random
+import threading
+from datetime import datetime, timedelta
+from Datos.db_conexion import conectar_sql
+from Datos.db_conexion_extras import ejecutar_sql_fetch, ejecutar_sql_lote
+from Configs.webhook_alerts import (
+    cargar_webhook_config, armar_envios, obtener_enviador, preparar_tablas_alertas,
+    registrar_alertas_enviadas
+)
+from Configs.logs_utils import escribir_log
+from Modulos.metricas import contar
+
+OUTBOX_SONDEO = 5              # Segundos entre revisiones de la bandeja si nadie avisa
+OUTBOX_LOTE = 200              # Alertas tomadas por ronda
+OUTBOX_MAX_INTENTOS = 8        # Tras esto la alerta pasa a 'muerta' (dead-letter)
+OUTBOX_BACKOFF_BASE = 5        # Segundos del primer reintento; se duplica en cada intento
+OUTBOX_BACKOFF_MAX = 900
+
+_QUERY_PENDIENTES = """
+    SELECT TOP (?) Id, Nombre, Fecha, Payload, Intentos
+    FROM AlertasOutbox
+    WHERE Estado = 'pendiente' AND ProximoIntento <= ?
+    ORDER BY ProximoIntento
+"""
+
+
+def espera_reintento(intentos):
+    """
+    Backoff exponencial con jitter: entre la mitad y el total de base * 2^(intentos-1).
+    """
+    tope = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (intentos - 1))
+    return random.uniform(tope / 2, tope)
+
+
+class TrabajadorOutbox:
+    """
+    Hilo que entrega las alertas de AlertasOutbox con su propia conexión SQL.
+    El ciclo de escaneo sólo encola; los reintentos no dependen de PING_INTERVAL
+    y una caída del receptor no agrega consultas al ciclo.
+    """
+
+    def __init__(self, config, sondeo=OUTBOX_SONDEO, tam_lote=OUTBOX_LOTE,
+                 max_intentos=OUTBOX_MAX_INTENTOS):
+        self._config = config
+        self._sondeo = sondeo
+        self._tam_lote = tam_lote
+        self._max_intentos = max_intentos
+        self._avisar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name="OutboxWebhook", daemon=True)
+        self._filas = {}  # Id -> (Nombre, Fecha, Intentos) de los envíos en vuelo
+
+        self.enviadas = 0
+        self.reintentos = 0
+        self.muertas = 0
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def avisar(self):
+        """
+        Despierta al hilo (hay alertas nuevas en la bandeja).
+        """
+        self._avisar.set()
+
+    def detener(self, timeout=10):
+        self._detener.set()
+        self._avisar.set()
+        self._hilo.join(timeout)
+
+    # ------------------------
+    # Hilo de entrega
+    # ------------------------
+    def _ronda(self, conn):
+        cfg = cargar_webhook_config()
+        if not cfg["webhook_url"]:
+            return
+
+        enviador = obtener_enviador(cfg)
+        resultados = enviador.tomar_tardios()
+
+        ids, payloads = [], []
+        for id_alerta, nombre, fecha, payload, intentos in ejecutar_sql_fetch(
+                conn, _QUERY_PENDIENTES, params=(self._tam_lote, datetime.now()), lanzar=True):
+            if enviador.en_curso(id_alerta):
+                continue
+            self._filas[id_alerta] = (nombre, fecha, intentos)
+            ids.append(id_alerta)
+            payloads.append(json.loads(payload))
+
+        # Con modo_lote (y gzip) un POST lleva varias alertas; la clave es la tupla de Ids
+        envios = armar_envios(payloads, cfg, claves=ids)
+        if envios:
+            resultados.update(enviador.enviar_todos(envios, espera=cfg["espera_envio"]))
+        if resultados:
+            self._registrar(conn, resultados)
+
+    def _registrar(self, conn, resultados):
+        ahora = datetime.now()
+        entregadas, fallidas, por_fecha = [], [], {}
+
+        por_id = {}
+        for clave, resultado in resultados.items():
+            for id_alerta in (clave if isinstance(clave, tuple) else (clave,)):
+                por_id[id_alerta] = resultado  # Un lote entrega (o falla) todas sus alertas juntas
+
+        for id_alerta, resultado in por_id.items():
+            nombre, fecha, intentos = self._filas.pop(id_alerta)
+            intentos += 1
+            if resultado == 200:
+                entregadas.append((intentos, ahora, id_alerta))
+                por_fecha.setdefault(fecha, []).append(nombre)
+                continue
+
+            error = f"HTTP {resultado}" if isinstance(resultado, int) else str(resultado)[:500]
+            if intentos >= self._max_intentos:
+                estado, proximo = "muerta", ahora
+                self.muertas += 1
+                escribir_log(f"Alerta de {nombre} descartada tras {intentos} intentos: {error}", tipo="ERROR")
+            else:
+                estado, proximo = "pendiente", ahora + timedelta(seconds=espera_reintento(intentos))
+                self.reintentos += 1
+            fallidas.append((estado, intentos, proximo, error, id_alerta))
+
+        # Si la base no responde se lanza el error para que _bucle reconecte; las
+        # alertas siguen 'pendiente' y se reintentan en la próxima ronda
+        if not ejecutar_sql_lote(conn, "UPDATE AlertasOutbox SET Estado = 'enviada', Intentos = ?, EnviadaEl = ? "
+                                       "WHERE Id = ?", entregadas):
+            raise RuntimeError(f"no se pudieron marcar {len(entregadas)} alertas como enviadas")
+        if not ejecutar_sql_lote(conn, "UPDATE AlertasOutbox SET Estado = ?, Intentos = ?, ProximoIntento = ?, "
+                                       "UltimoError = ? WHERE Id = ?", fallidas):
+            raise RuntimeError(f"no se pudieron reprogramar {len(fallidas)} alertas fallidas")
+        for fecha, nombres in por_fecha.items():
+            if not registrar_alertas_enviadas(conn, nombres, fecha):
+                raise RuntimeError(f"no se pudieron registrar {len(nombres)} alertas del {fecha}")
+
+        self.enviadas += len(entregadas)
+        contar("webhook_ok", len(entregadas))
+        contar("webhook_error", len(fallidas))
+        print(f"[ALERTAS] Outbox: {len(entregadas)} entregadas, {len(fallidas)} fallidas")
+
+    def _bucle(self):
+        conn = conectar_sql(self._config)
+        preparar_tablas_alertas(conn)
+
+        while not self._detener.is_set():
+            try:
+                self._ronda(conn)
+            except Exception as e:
+                escribir_log(f"Outbox de alertas: error en la ronda, reconectando: {e}", tipo="ERROR")
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = conectar_sql(self._config)
+
+            self._avisar.wait(self._sondeo)
+            self._avisar.clear()
+
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -2,14 +2,16 @@
 import traceback
 from Configs.webhook_alerts import enviar_alertas_inactividad
 from Configs.logs_utils import escribir_log
+from Modulos.metricas import medir
 
-def enviar_notificacion_webhook(conn):
+def enviar_notificacion_webhook(conn, outbox=None):
     """
-    Wrapper seguro: llama a enviar_alertas_inactividad(conn).
+    Wrapper seguro: llama a enviar_alertas_inactividad(conn, outbox).
     Si ocurre cualquier excepción, lo registra en logs y no propaga el error.
     """
     try:
-        enviar_alertas_inactividad(conn)
+        with medir("webhook"):
+            enviar_alertas_inactividad(conn, outbox)
     except Exception as e:
         # Registrar el error pero NO detener el programa
         escribir_log(f"Error en enviar_notificacion_webhook: {e}", tipo="ERROR")
@@ -0,0 +1,262 @@
+# ---------------------------------------
+# Archivo: Datos/db_bulk.py
+# Escritura por lotes (set-based) de EquiposAD
+# ---------------------------------------
+
+import json
+import time
+import random
+
+# Orden de las columnas en cada fila del lote (mismo orden que el MERGE por fila)
+COLUMNAS_EQUIPO = [
+    "Nombre", "SO", "Descripcion", "IP", "NombreDNS", "VersionSO", "CreadoEl",
+    "UltimoLogon", "Responsable", "Ubicacion", "EstadoCuenta", "PingStatus",
+    "TiempoPing", "InactivoDesde", "EstadoAD", "ActivoTiempo"
+]
+
+_CREAR_STAGE = """
+    IF OBJECT_ID('tempdb..#EquiposStage') IS NOT NULL DROP TABLE #EquiposStage;
+    CREATE TABLE #EquiposStage (
+        Nombre NVARCHAR(255) NOT NULL,
+        SO NVARCHAR(255),
+        Descripcion NVARCHAR(255),
+        IP NVARCHAR(50),
+        NombreDNS NVARCHAR(255),
+        VersionSO NVARCHAR(255),
+        CreadoEl NVARCHAR(100),
+        UltimoLogon NVARCHAR(100),
+        Responsable NVARCHAR(255),
+        Ubicacion NVARCHAR(255),
+        EstadoCuenta NVARCHAR(50),
+        PingStatus NVARCHAR(50),
+        TiempoPing NVARCHAR(50),
+        InactivoDesde DATETIME NULL,
+        EstadoAD NVARCHAR(50),
+        ActivoTiempo NVARCHAR(30) NULL
+    );
+"""
+
+_MERGE_STAGE = """
+    MERGE EquiposAD AS target
+    USING #EquiposStage AS src
+    ON target.Nombre = src.Nombre
+    WHEN MATCHED THEN
+        UPDATE SET {actualizar},
+                   target.UltimaActualizacion = GETDATE()
+    WHEN NOT MATCHED THEN
+        INSERT ({columnas})
+        VALUES ({valores});
+    DROP TABLE #EquiposStage;
+""".format(
+    actualizar=",\n                   ".join(f"target.{c} = src.{c}" for c in COLUMNAS_EQUIPO[1:]),
+    columnas=", ".join(COLUMNAS_EQUIPO),
+    valores=", ".join(f"src.{c}" for c in COLUMNAS_EQUIPO),
+)
+
+# Versión para SQLite (pruebas locales): UPSERT nativo en lugar de MERGE + tabla temporal
+_UPSERT_SQLITE = """
+    INSERT INTO EquiposAD ({columnas}) VALUES ({marcas})
+    ON CONFLICT(Nombre) DO UPDATE SET {actualizar},
+        UltimaActualizacion = CURRENT_TIMESTAMP
+""".format(
+    columnas=", ".join(COLUMNAS_EQUIPO),
+    marcas=", ".join("?" for _ in COLUMNAS_EQUIPO),
+    actualizar=", ".join(f"{c} = excluded.{c}" for c in COLUMNAS_EQUIPO[1:]),
+)
+
+
+def es_sqlite(conn):
+    return type(conn).__module__.startswith("sqlite3")
+
+
+def _escribir_sqlserver(conn, filas):
+    cursor = conn.cursor()
+    cursor.execute(_CREAR_STAGE)
+    cursor.fast_executemany = True
+    cursor.executemany(
+        f"INSERT INTO #EquiposStage ({', '.join(COLUMNAS_EQUIPO)}) "
+        f"VALUES ({', '.join('?' for _ in COLUMNAS_EQUIPO)})",
+        filas
+    )
+    cursor.execute(_MERGE_STAGE)
+
+
+def _escribir_sqlite(conn, filas):
+    conn.cursor().executemany(_UPSERT_SQLITE, filas)
+
+
+def con_reintentos(conn, operacion, descripcion, intentos, espera):
+    """
+    Ejecuta 'operacion(conn)' y hace commit; si falla hace rollback y reintenta.
+    """
+    ultimo_error = None
+
+    for i in range(1, intentos + 1):
+        try:
+            operacion(conn)
+            conn.commit()
+            return True
+
+        except Exception as e:
+            ultimo_error = e
+            print(f"[SQL LOTE] Error intento {i}/{intentos} ({descripcion}): {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            if i < intentos:
+                time.sleep(espera)
+
+    print(f"[SQL LOTE] Falló definitivamente: {ultimo_error}")
+    return False
+
+
+def _sin_duplicados(filas):
+    # El MERGE falla si el origen trae dos veces el mismo Nombre: gana la última fila
+    return list({fila[0]: tuple(fila) for fila in filas}.values())
+
+
+# -----------------------------------------------------
+# Upsert de todo el ciclo en una sola transacción
+# -----------------------------------------------------
+def upsert_equipos_lote(conn, filas, intentos=3, espera=2):
+    """
+    Escribe en EquiposAD todas las filas del ciclo de una vez: carga una tabla
+    temporal con fast_executemany, hace un único MERGE y un solo commit.
+    Cada fila es una secuencia con los valores en el orden de COLUMNAS_EQUIPO.
+    Con una conexión sqlite3 usa INSERT ... ON CONFLICT (misma interfaz, para pruebas).
+    Devuelve True si el lote quedó escrito.
+    """
+    filas = _sin_duplicados(filas)
+    if not filas:
+        return True
+
+    escribir = _escribir_sqlite if es_sqlite(conn) else _escribir_sqlserver
+    return con_reintentos(conn, lambda c: escribir(c, filas), f"{len(filas)} filas", intentos, espera)
+
+
+# -----------------------------------------------------
+# Escribir sólo lo que cambió
+# -----------------------------------------------------
+# Columnas que cambian en cada ciclo (tiempos acumulados): por sí solas no
+# disparan escritura; viajan junto a otro cambio o con el latido (heartbeat).
+COLUMNAS_VOLATILES = {"TiempoPing", "ActivoTiempo"}
+SQL_HEARTBEAT = 300
+
+_INDICES_FIJOS = [i for i, c in enumerate(COLUMNAS_EQUIPO) if i > 0 and c not in COLUMNAS_VOLATILES]
+_INDICES_VOLATILES = [i for i, c in enumerate(COLUMNAS_EQUIPO) if c in COLUMNAS_VOLATILES]
+
+# Nombre -> (fila tal como quedó en la base, instante monotónico de la última escritura)
+snapshot_equipos = {}
+
+
+def _diferencias(filas, heartbeat, ahora):
+    """
+    Compara cada fila contra el snapshot. Devuelve las filas nuevas (MERGE completo)
+    y los cambios agrupados por el conjunto de columnas a actualizar.
+    """
+    nuevas, grupos = [], {}
+    for fila in filas:
+        previa = snapshot_equipos.get(fila[0])
+        if previa is None:
+            nuevas.append(fila)
+            continue
+
+        anterior, ultimo = previa
+        cambiadas = [i for i in _INDICES_FIJOS if fila[i] != anterior[i]]
+        if cambiadas or ahora - ultimo >= heartbeat:
+            cambiadas += [i for i in _INDICES_VOLATILES if fila[i] != anterior[i]]
+            grupos.setdefault(tuple(sorted(cambiadas)), []).append(fila)
+    return nuevas, grupos
+
+
+def _actualizar_grupos(conn, grupos):
+    """
+    Un UPDATE parametrizado por grupo de columnas, enviado como arreglo (executemany).
+    Un grupo sin columnas es un latido: sólo mueve UltimaActualizacion.
+    """
+    ahora_sql = "CURRENT_TIMESTAMP" if es_sqlite(conn) else "GETDATE()"
+    cursor = conn.cursor()
+    if not es_sqlite(conn):
+        cursor.fast_executemany = True
+
+    for indices, filas in grupos.items():
+        asignaciones = [f"{COLUMNAS_EQUIPO[i]} = ?" for i in indices]
+        asignaciones.append(f"UltimaActualizacion = {ahora_sql}")
+        cursor.executemany(
+            f"UPDATE EquiposAD SET {', '.join(asignaciones)} WHERE Nombre = ?",
+            [tuple(fila[i] for i in indices) + (fila[0],) for fila in filas]
+        )
+
+
+def escribir_equipos_cambios(conn, filas, heartbeat=SQL_HEARTBEAT, intentos=3, espera=2):
+    """
+    Como upsert_equipos_lote pero escribe sólo las filas y columnas que cambiaron
+    desde la última escritura (snapshot en memoria). Las filas sin cambios se
+    tocan a lo sumo una vez cada 'heartbeat' segundos.
+    Devuelve True si todo quedó escrito.
+    """
+    ahora = time.monotonic()
+    filas = _sin_duplicados(filas)
+    nuevas, grupos = _diferencias(filas, heartbeat, ahora)
+    actualizadas = sum(len(f) for f in grupos.values())
+
+    if nuevas or grupos:
+        escribir_nuevas = _escribir_sqlite if es_sqlite(conn) else _escribir_sqlserver
+
+        def operacion(c):
+            if nuevas:
+                escribir_nuevas(c, nuevas)
+            if grupos:
+                _actualizar_grupos(c, grupos)
+
+        if not con_reintentos(conn, operacion, f"{len(nuevas)} nuevas, {actualizadas} cambios", intentos, espera):
+            return False  # El snapshot no se toca: el próximo ciclo vuelve a intentar
+
+    # Las filas nuevas reparten su primer latido en el intervalo para no coincidir todas
+    for fila in nuevas:
+        snapshot_equipos[fila[0]] = (fila, ahora - random.uniform(0, heartbeat))
+    for filas_grupo in grupos.values():
+        for fila in filas_grupo:
+            snapshot_equipos[fila[0]] = (fila, ahora)
+
+    print(f"[SQL LOTE] {len(nuevas)} nuevas, {actualizadas} actualizadas, "
+          f"{len(filas) - len(nuevas) - actualizadas} sin cambios")
+    return True
+
+
+# -----------------------------------------------------
+# Equipos que ya no están en AD
+# -----------------------------------------------------
+# Los nombres viajan como un único parámetro JSON: una sola sentencia y un solo
+# viaje a la base, sin importar cuántos equipos se marquen.
+_MARCAR_REMOVIDOS = """
+    UPDATE EquiposAD
+    SET EstadoAD = 'Removido de AD', UltimaActualizacion = {ahora}
+    WHERE Nombre IN (SELECT value FROM {json}(?))
+"""
+
+
+def marcar_removidos(conn, nombres, intentos=3, espera=2):
+    """
+    Marca como "Removido de AD" todos los equipos indicados con un solo UPDATE.
+    Devuelve True si quedó escrito.
+    """
+    nombres = sorted(nombres)
+    if not nombres:
+        return True
+
+    if es_sqlite(conn):
+        query = _MARCAR_REMOVIDOS.format(ahora="CURRENT_TIMESTAMP", json="json_each")
+    else:
+        query = _MARCAR_REMOVIDOS.format(ahora="GETDATE()", json="OPENJSON")
+    parametro = json.dumps(nombres, ensure_ascii=False)
+
+    def operacion(c):
+        c.cursor().execute(query, (parametro,))
+
+    escrito = con_reintentos(conn, operacion, f"{len(nombres)} removidos de AD", intentos, espera)
+    if escrito:
+        for nombre in nombres:
+            snapshot_equipos.pop(nombre, None)  # Si vuelve a AD se escribe completo
+    return escrito
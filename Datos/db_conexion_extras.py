@@ -6,6 +6,7 @@
 import time
 import pyodbc
 from Datos.db_conexion import conectar_sql  # usa tu conexión actual con encriptación
+from Datos.db_bulk import con_reintentos, es_sqlite
 
 # -----------------------------------------------------
 # Query con reintentos y sin comprometer el original
@@ -42,9 +43,10 @@ def ejecutar_sql_reintento(conn, query, params=(), intentos=3, espera=2, fetch=F
 # -----------------------------------------------------
 # Query con fetch garantizado (para SELECT)
 # -----------------------------------------------------
-def ejecutar_sql_fetch(conn, query, params=()):
+def ejecutar_sql_fetch(conn, query, params=(), lanzar=False):
     """
     Solo SELECT. Devuelve listas de filas o [] si falla.
+    Con lanzar=True propaga el error (para quien reconecta al fallar).
     """
     try:
         cursor = conn.cursor()
@@ -52,4 +54,28 @@ def ejecutar_sql_fetch(conn, query, params=()):
         return cursor.fetchall()
     except Exception as e:
         print("[SQL FETCH ERROR]", e)
+        if lanzar:
+            raise
         return []
+
+
+# -----------------------------------------------------
+# Mismo SQL para muchas filas (executemany) en una transacción
+# -----------------------------------------------------
+def ejecutar_sql_lote(conn, query, filas, intentos=3, espera=2):
+    """
+    Ejecuta 'query' una vez por cada fila de parámetros, con un solo commit.
+    Los reintentos (con rollback) son los de db_bulk.con_reintentos.
+    Devuelve True si quedó escrito, False si falla tras los reintentos.
+    """
+    filas = list(filas)
+    if not filas:
+        return True
+
+    def ejecutar(c):
+        cursor = c.cursor()
+        if not es_sqlite(c):
+            cursor.fast_executemany = True
+        cursor.executemany(query, filas)
+
+    return con_reintentos(conn, ejecutar, f"{len(filas)} filas", intentos, espera)
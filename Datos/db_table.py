@@ -25,7 +25,13 @@ def crear_tabla(conn, config):
             EstadoAD NVARCHAR(50) DEFAULT 'Dentro de AD',
             UltimoWebhook DATE NULL,
             UltimaActualizacion DATETIME DEFAULT GETDATE()
-        )
+        );
+
+        -- Índice filtrado para la consulta de candidatos a alerta
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='IX_EquiposAD_InactivoDesde')
+        CREATE INDEX IX_EquiposAD_InactivoDesde ON EquiposAD (InactivoDesde)
+            INCLUDE (IP, Descripcion, Responsable, Ubicacion)
+            WHERE InactivoDesde IS NOT NULL;
     """
     if ejecutar_sql(conn, query, config=config):
         print("[OK] Tabla 'EquiposAD' verificada o creada.")
@@ -0,0 +1,125 @@
+# ---------------------------------------
+# Archivo: Datos/db_writer.py
+# Escritor SQL en segundo plano con cola acotada
+# ---------------------------------------
+
+import time
+import queue
+import threading
+from Datos.db_conexion import conectar_sql
+from Datos.db_bulk import upsert_equipos_lote, escribir_equipos_cambios, SQL_HEARTBEAT
+from Configs.logs_utils import escribir_log
+from Modulos.metricas import registrar
+from Modulos.ad_utils import estado_equipos
+
+SQL_COLA_MAX = 20000      # Filas en espera antes de frenar a los hilos de ping
+SQL_LOTE_FILAS = 500      # Se escribe al juntar estas filas...
+SQL_LOTE_SEGUNDOS = 2.0   # ...o cuando la fila más vieja lleva este tiempo esperando
+
+
+class EscritorSQL:
+    """
+    Hilo dedicado que escribe las filas de EquiposAD con su propia conexión.
+    Los hilos de ping sólo encolan; si la cola se llena, encolar() espera
+    (backpressure) en lugar de acumular memoria sin límite.
+    """
+
+    def __init__(self, config, modo="lote", heartbeat=SQL_HEARTBEAT, max_cola=SQL_COLA_MAX,
+                 tam_lote=SQL_LOTE_FILAS, intervalo=SQL_LOTE_SEGUNDOS):
+        self._config = config
+        self._modo = modo
+        self._heartbeat = heartbeat
+        self._tam_lote = tam_lote
+        self._intervalo = intervalo
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name="EscritorSQL", daemon=True)
+
+        self.filas_escritas = 0
+        self.filas_descartadas = 0
+        self.lotes = 0
+        self.ultimo_lote_segundos = 0.0
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def encolar(self, fila):
+        """
+        Agrega una fila (orden de COLUMNAS_EQUIPO). Bloquea si la cola está llena.
+        """
+        self._cola.put(fila)
+
+    def profundidad(self):
+        return self._cola.qsize()
+
+    def detener(self, timeout=30):
+        """
+        Escribe lo que quede en la cola y termina el hilo.
+        """
+        self._detener.set()
+        self._hilo.join(timeout)
+
+    # ------------------------
+    # Hilo escritor
+    # ------------------------
+    def _escribir(self, conn, filas):
+        if self._modo == "cambios":
+            return escribir_equipos_cambios(conn, filas, heartbeat=self._heartbeat)
+        return upsert_equipos_lote(conn, filas)
+
+    def _vaciar(self, conn, filas):
+        inicio = time.perf_counter()
+        ok = self._escribir(conn, filas)
+        if not ok:
+            # Tras agotar los reintentos del lote se prueba una vez con conexión nueva
+            escribir_log("Escritor SQL: reconectando tras fallo de lote", tipo="WARNING")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            conn = conectar_sql(self._config)
+            ok = self._escribir(conn, filas)
+
+        self.ultimo_lote_segundos = time.perf_counter() - inicio
+        registrar("sql_lote", self.ultimo_lote_segundos)
+        if ok:
+            self.filas_escritas += len(filas)
+            self.lotes += 1
+        else:
+            self.filas_descartadas += len(filas)
+            # En modo cambios/vectorizado ya figuran como escritos: que salgan de nuevo el próximo ciclo
+            estado_equipos.marcar_sin_escribir([fila[0] for fila in filas])
+            escribir_log(f"Escritor SQL: se descartaron {len(filas)} filas "
+                         f"(cola: {self.profundidad()})", tipo="ERROR")
+        return conn
+
+    def _bucle(self):
+        conn = conectar_sql(self._config)
+        pendientes = []
+        limite = 0.0
+
+        while True:
+            espera = max(0.0, limite - time.monotonic()) if pendientes else 0.5
+            try:
+                pendientes.append(self._cola.get(timeout=espera))
+                if len(pendientes) == 1:
+                    limite = time.monotonic() + self._intervalo
+                # Tomar sin esperar lo que ya esté en la cola, hasta completar el lote
+                while len(pendientes) < self._tam_lote:
+                    pendientes.append(self._cola.get_nowait())
+            except queue.Empty:
+                pass
+
+            deteniendo = self._detener.is_set()
+            if pendientes and (len(pendientes) >= self._tam_lote or time.monotonic() >= limite or deteniendo):
+                conn = self._vaciar(conn, pendientes)
+                pendientes = []
+
+            if deteniendo and not pendientes and self._cola.empty():
+                break
+
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,145 @@
+import time
+from threading import Lock
+from contextlib import contextmanager
+from ldap3 import Server, Connection, ALL, NONE, BASE, SUBTREE, OFFLINE_AD_2012_R2
+from ldap3.core.exceptions import LDAPException, LDAPCommunicationError, LDAPResponseTimeoutError
+from Configs.logs_utils import escribir_log
+
+# ------------------------
+# Información del servidor
+# ------------------------
+# "offline" usa el esquema de AD que trae ldap3: los atributos se formatean igual
+# que con get_info=ALL pero sin descargar esquema ni DSA info del DC.
+AD_INFO_MODOS = {
+    "offline": OFFLINE_AD_2012_R2,
+    "none": NONE,
+    "all": ALL,
+}
+AD_CHEQUEO_SEGUNDOS = 60   # Sin uso durante este tiempo, se verifica la sesión antes de reutilizarla
+AD_TIMEOUT = 10
+
+
+# ------------------------
+# Conexión LDAP persistente
+# ------------------------
+class GestorConexionAD:
+    """
+    Mantiene una única conexión LDAP autenticada y la reutiliza entre ciclos.
+    Verifica la sesión si estuvo ociosa y vuelve a conectar/autenticar
+    cuando el DC la cerró o falló la red.
+    """
+
+    def __init__(self, servidor, usuario, password, info="offline",
+                 chequeo_segundos=AD_CHEQUEO_SEGUNDOS, timeout=AD_TIMEOUT):
+        self.server = Server(servidor, get_info=AD_INFO_MODOS.get(info, OFFLINE_AD_2012_R2),
+                             connect_timeout=timeout)
+        self._usuario = usuario
+        self._password = password
+        self._timeout = timeout
+        self._chequeo_segundos = chequeo_segundos
+        self._conn = None
+        self._ultimo_uso = 0.0
+        self._lock = Lock()
+        self.reconexiones = 0
+
+    def _conectar(self):
+        self._descartar()
+        self._conn = Connection(self.server, user=self._usuario, password=self._password,
+                                auto_bind=True, read_only=True, receive_timeout=self._timeout)
+        self.reconexiones += 1
+        escribir_log(f"Conexión LDAP establecida con {self.server.host} (#{self.reconexiones})", tipo="INFO")
+
+    def _descartar(self):
+        if self._conn is not None:
+            try:
+                self._conn.unbind()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _sesion_valida(self):
+        conn = self._conn
+        if conn is None or conn.closed or not conn.bound:
+            return False
+        if time.monotonic() - self._ultimo_uso < self._chequeo_segundos:
+            return True
+        # Chequeo liviano contra el rootDSE
+        try:
+            return conn.search("", "(objectClass=*)", search_scope=BASE, attributes=["currentTime"])
+        except LDAPException:
+            return False
+
+    @contextmanager
+    def conexion(self):
+        """
+        Entrega la conexión compartida (sana) con uso exclusivo.
+        Si durante su uso se corta la comunicación, se descarta para reconectar la próxima vez.
+        """
+        with self._lock:
+            if not self._sesion_valida():
+                self._conectar()
+            try:
+                yield self._conn
+            except (LDAPCommunicationError, LDAPResponseTimeoutError):
+                self._descartar()
+                raise
+            finally:
+                self._ultimo_uso = time.monotonic()
+
+    def cerrar(self):
+        with self._lock:
+            self._descartar()
+
+
+# ------------------------
+# Búsquedas comunes
+# ------------------------
+def buscar_paginado(conn, base, filtro, atributos, tamano_pagina, controles=None, alcance=SUBTREE):
+    """
+    Generador: búsqueda con Simple Paged Results. Entrega cada entrada completa
+    ("attributes" y "raw_attributes") a medida que llegan las páginas.
+    'controles' son controles LDAP extra, como tuplas (OID, crítico, valor).
+    """
+    entradas = conn.extend.standard.paged_search(
+        base,
+        filtro,
+        search_scope=alcance,
+        attributes=atributos,
+        paged_size=tamano_pagina,
+        controls=controles,
+        generator=True
+    )
+    for entrada in entradas:
+        if entrada.get("type") != "searchResEntry":
+            continue  # Referencias a otros dominios
+        yield entrada
+
+
+def _primero(valor):
+    if isinstance(valor, (list, tuple)):
+        return valor[0] if valor else None
+    return valor
+
+
+def leer_contexto_dominio(conn):
+    """
+    defaultNamingContext del rootDSE (DN raíz del dominio, p. ej. DC=empresa,DC=local).
+    """
+    conn.search("", "(objectClass=*)", search_scope=BASE, attributes=["defaultNamingContext"])
+    return str(_primero(conn.response[0]["attributes"]["defaultNamingContext"]))
+
+
+def leer_marca_dc(conn):
+    """
+    Lee del rootDSE el highestCommittedUSN y el invocationId del DC conectado.
+    El uSNChanged es local a cada DC: la marca sólo sirve contra el mismo invocationId.
+    """
+    conn.search("", "(objectClass=*)", search_scope=BASE,
+                attributes=["highestCommittedUSN", "dsServiceName"])
+    raiz = conn.response[0]["attributes"]
+    usn = int(_primero(raiz["highestCommittedUSN"]))
+
+    conn.search(str(_primero(raiz["dsServiceName"])), "(objectClass=*)",
+                search_scope=BASE, attributes=["invocationId"])
+    invocation_id = str(_primero(conn.response[0]["attributes"]["invocationId"]))
+    return usn, invocation_id
@@ -0,0 +1,102 @@
+from ldap3 import LEVEL
+from Modulos.ad_utils import _gestor_ad, _valor_atributo, inventario_ad, AD_PAGE_SIZE
+from Modulos.ad_conexion import buscar_paginado, leer_marca_dc, leer_contexto_dominio
+from Modulos.reconciliacion import olvidar_equipos
+from Datos.db_bulk import marcar_removidos
+from Configs.logs_utils import escribir_log
+
+# ------------------------
+# Equipos eliminados de AD (contenedor Deleted Objects)
+# ------------------------
+# Con el control Show Deleted, AD devuelve los objetos borrados (isDeleted=TRUE)
+# que quedan como tombstone (o en la papelera de reciclaje) bajo CN=Deleted Objects.
+# Un equipo movido fuera de AD_SEARCH_BASE no aparece acá: sólo los borrados.
+SHOW_DELETED_OID = "1.2.840.113556.1.4.417"
+ATRIBUTOS_ELIMINADOS = ["msDS-LastKnownRDN", "sAMAccountName", "objectGUID", "lastKnownParent", "uSNChanged"]
+
+# Marca del último uSNChanged revisado, por DC (invocationId)
+seguimiento_eliminados = {"usn": None, "invocation_id": None, "contexto": None}
+
+
+def _texto(atributos, clave):
+    valor = _valor_atributo(atributos, clave)
+    return None if valor == "N/A" else valor
+
+
+def _nombre_eliminado(atributos):
+    """
+    Nombre original del equipo: msDS-LastKnownRDN (con papelera de reciclaje)
+    o el sAMAccountName sin el "$" final (se conserva en el tombstone).
+    """
+    nombre = _texto(atributos, "msDS-LastKnownRDN")
+    if not nombre:
+        cuenta = _texto(atributos, "sAMAccountName") or ""
+        nombre = cuenta[:-1] if cuenta.endswith("$") else cuenta
+    return nombre or None
+
+
+def _bajo_base(atributos, base):
+    # Sin lastKnownParent no se puede saber dónde estaba: se cuenta
+    padre = _texto(atributos, "lastKnownParent")
+    return not padre or padre.lower().endswith(base.lower())
+
+
+def leer_eliminados_ad(config):
+    """
+    Consulta incremental de equipos borrados desde la última marca (uSNChanged).
+    La primera vez (o si cambió el DC) sólo fija la marca: los borrados anteriores
+    los detecta la reconciliación. Devuelve ([(nombre, objectGUID)] de los equipos
+    borrados que estaban bajo AD_SEARCH_BASE, nueva marca); la marca la avanza
+    quien termina de procesarlos.
+    """
+    eliminados = []
+    with _gestor_ad(config).conexion() as conn:
+        usn, invocation_id = leer_marca_dc(conn)
+        if seguimiento_eliminados["usn"] is None or invocation_id != seguimiento_eliminados["invocation_id"]:
+            seguimiento_eliminados.update(usn=usn, invocation_id=invocation_id,
+                                          contexto=leer_contexto_dominio(conn))
+            escribir_log(f"Seguimiento de equipos eliminados desde USN {usn}", tipo="INFO")
+            return eliminados, usn
+
+        filtro = f"(&(objectClass=computer)(isDeleted=TRUE)(uSNChanged>={seguimiento_eliminados['usn'] + 1}))"
+        entradas = buscar_paginado(
+            conn, f"CN=Deleted Objects,{seguimiento_eliminados['contexto']}", filtro,
+            ATRIBUTOS_ELIMINADOS, int(config.get("AD_PAGE_SIZE", AD_PAGE_SIZE)),
+            controles=[(SHOW_DELETED_OID, True, None)], alcance=LEVEL
+        )
+        for entrada in entradas:
+            atributos = entrada["attributes"]
+            nombre = _nombre_eliminado(atributos)
+            if nombre and _bajo_base(atributos, config["AD_SEARCH_BASE"]):
+                eliminados.append((nombre, _valor_atributo(atributos, "objectGUID")))
+
+    return eliminados, usn
+
+
+def procesar_eliminados_ad(conn, config, alertas=None):
+    """
+    Marca como "Removido de AD" (un solo UPDATE) los equipos borrados desde el
+    ciclo anterior, los saca del inventario incremental y los olvida en memoria.
+    Devuelve los nombres marcados.
+    """
+    try:
+        eliminados, usn = leer_eliminados_ad(config)
+    except Exception as e:
+        escribir_log(f"No se pudieron leer los equipos eliminados de AD: {e}", tipo="ERROR")
+        return []
+
+    nombres = {nombre for nombre, _ in eliminados}
+    if nombres and not marcar_removidos(conn, nombres):
+        # La marca no avanza: se vuelven a pedir en el próximo ciclo
+        escribir_log(f"No se pudieron marcar {len(nombres)} equipos eliminados de AD", tipo="ERROR")
+        return []
+    seguimiento_eliminados["usn"] = usn
+    if not nombres:
+        return []
+
+    for _, guid in eliminados:
+        inventario_ad.pop(guid, None)  # Sincronización incremental: ya no se sondea
+    olvidar_equipos(nombres, alertas)
+    escribir_log(f"Eliminados de AD: {len(nombres)} equipos ({', '.join(sorted(nombres)[:10])}"
+                 f"{', ...' if len(nombres) > 10 else ''})", tipo="WARNING")
+    return sorted(nombres)
@@ -1,18 +1,29 @@
 
-import socket
 import subprocess
 import platform
 import time
+import math
+import zlib
 from datetime import datetime
 from ldap3 import Server, Connection, ALL
 from Datos.db_conexion import conectar_sql
+from Datos.db_bulk import upsert_equipos_lote, escribir_equipos_cambios, SQL_HEARTBEAT
 from Configs.logs_utils import escribir_log
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from collections import Counter, deque
+from operator import itemgetter
 from threading import Lock
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from cryptography.fernet import Fernet  # <-- nuevo
+from Modulos.ping_utils import barrido_icmp, SondeoICMP
+from Modulos.ad_conexion import GestorConexionAD, buscar_paginado, leer_marca_dc
+from Modulos.dns_utils import resolver_nombres, DNS_TTL_POSITIVO, DNS_TTL_NEGATIVO, DNS_MAX_HILOS
+from Modulos.dns_ad import actualizar_zona_dns, zona_dns
+from Modulos.metricas import medir, registrar, fijar
+from Modulos.estado_equipos import EstadoEquipos
 
-estado_ping = {}
+estado_equipos = EstadoEquipos()
 
 # ------------------------
 # Helpers de encriptación
@@ -86,65 +97,203 @@ def validar_ad(credenciales):
 # ------------------------
 # Obtener equipos desde AD
 # ------------------------
+AD_ATRIBUTOS = [
+    "name", "dNSHostName", "operatingSystem", "operatingSystemVersion",
+    "description", "whenCreated", "lastLogonTimestamp", "managedBy",
+    "location", "userAccountControl"
+]
+AD_PAGE_SIZE = 500   # Por debajo del MaxPageSize (1000) por defecto de AD
 
 
-def obtener_equipos_ad(config):
+def _valor_atributo(atributos, clave):
     """
-    Obtiene los equipos de AD usando las credenciales actuales.
-    Acepta credenciales en texto plano o encriptadas.
+    Devuelve el atributo LDAP como texto, o "N/A" si no viene o está vacío.
     """
-    equipos = []
-    try:
-        server = Server(config["AD_SERVER"], get_info=ALL)
-        user = _maybe_decrypt(config.get("AD_USER", ""))
-        password = _maybe_decrypt(config.get("AD_PASSWORD", ""))
-        conn = Connection(server, user=user, password=password, auto_bind=True)
-        conn.search(
-            config["AD_SEARCH_BASE"],
-            "(objectClass=computer)",
-            attributes=[
-                "name", "dNSHostName", "operatingSystem", "operatingSystemVersion",
-                "description", "whenCreated", "lastLogonTimestamp", "managedBy",
-                "location", "userAccountControl"
-            ]
+    valor = atributos.get(clave)
+    if valor is None or valor == [] or valor == "":
+        return "N/A"
+    if isinstance(valor, (list, tuple)):
+        return str(valor[0]) if len(valor) == 1 else ", ".join(str(v) for v in valor)
+    return str(valor)
+
+
+def _datos_ad(atributos):
+    """
+    Convierte los atributos crudos de una entrada LDAP en el registro
+    compacto de equipo que usa el resto del programa (sin IP).
+    """
+    return {
+        "nombre": _valor_atributo(atributos, "name"),
+        "so": _valor_atributo(atributos, "operatingSystem"),
+        "descripcion": _valor_atributo(atributos, "description"),
+        "nombredns": _valor_atributo(atributos, "dNSHostName"),
+        "versionso": _valor_atributo(atributos, "operatingSystemVersion"),
+        "creadoel": _valor_atributo(atributos, "whenCreated"),
+        "ultimologon": _valor_atributo(atributos, "lastLogonTimestamp"),
+        "responsable": _valor_atributo(atributos, "managedBy"),
+        "ubicacion": _valor_atributo(atributos, "location"),
+        "estadocuenta": _valor_atributo(atributos, "userAccountControl")
+    }
+
+
+def resolver_ips(registros, config):
+    """
+    Etapa de resolución de nombres: completa la IP de cada registro resolviendo
+    todos los nombres del lote en paralelo, con caché positiva y negativa.
+    Con DNS_MODO="ad" se busca primero en la zona DNS leída de AD.
+    """
+    zona = zona_dns if config.get("DNS_MODO", "socket").lower() == "ad" else None
+    with medir("dns_lote"):
+        ips = resolver_nombres(
+            [datos["nombre"] for datos in registros],
+            ttl_positivo=int(config.get("DNS_TTL", DNS_TTL_POSITIVO)),
+            ttl_negativo=int(config.get("DNS_TTL_NEGATIVO", DNS_TTL_NEGATIVO)),
+            max_hilos=int(config.get("DNS_HILOS", DNS_MAX_HILOS)),
+            zona=zona
         )
-        for entry in conn.entries:
-            nombre = str(entry.name)
-            so = str(entry.operatingSystem) if hasattr(entry, 'operatingSystem') else "N/A"
-            desc = str(entry.description) if hasattr(entry, 'description') else "N/A"
-            nombre_dns = str(entry.dNSHostName) if hasattr(entry, 'dNSHostName') else "N/A"
-            version_so = str(entry.operatingSystemVersion) if hasattr(entry, 'operatingSystemVersion') else "N/A"
-            creado_el = str(entry.whenCreated) if hasattr(entry, 'whenCreated') else "N/A"
-            ultimo_logon = str(entry.lastLogonTimestamp) if hasattr(entry, 'lastLogonTimestamp') else "N/A"
-            responsable = str(entry.managedBy) if hasattr(entry, 'managedBy') else "N/A"
-            ubicacion = str(entry.location) if hasattr(entry, 'location') else "N/A"
-            estado_cuenta = str(entry.userAccountControl) if hasattr(entry, 'userAccountControl') else "N/A"
-
-            try:
-                ip = socket.gethostbyname(nombre)
-            except socket.gaierror:
-                ip = "No resuelve"
-
-            equipos.append({
-                "nombre": nombre,
-                "so": so,
-                "descripcion": desc,
-                "ip": ip,
-                "nombredns": nombre_dns,
-                "versionso": version_so,
-                "creadoel": creado_el,
-                "ultimologon": ultimo_logon,
-                "responsable": responsable,
-                "ubicacion": ubicacion,
-                "estadocuenta": estado_cuenta
-            })
-
-        escribir_log(f"Equipos obtenidos desde AD: {len(equipos)}", tipo="INFO")
+    return [{**datos, "ip": ips[datos["nombre"]]} for datos in registros]
+
+
+# Gestores de conexión persistente por (servidor, usuario, password, modo de info)
+_gestores_ad = {}
+_gestores_lock = Lock()
+
+
+def _gestor_ad(config):
+    """
+    Devuelve el GestorConexionAD de esta configuración, creándolo la primera vez.
+    Las credenciales (texto plano o encriptadas) se desencriptan una sola vez.
+    """
+    clave = (config["AD_SERVER"], config.get("AD_USER", ""), config.get("AD_PASSWORD", ""),
+             config.get("AD_SERVER_INFO", "offline").lower())
+    with _gestores_lock:
+        gestor = _gestores_ad.get(clave)
+        if gestor is None:
+            gestor = GestorConexionAD(
+                config["AD_SERVER"],
+                _maybe_decrypt(config.get("AD_USER", "")),
+                _maybe_decrypt(config.get("AD_PASSWORD", "")),
+                info=clave[3]
+            )
+            _gestores_ad[clave] = gestor
+        return gestor
+
+
+def _buscar_computadoras(conn, config, filtro="(objectClass=computer)", atributos=AD_ATRIBUTOS):
+    """
+    Generador: búsqueda paginada (Simple Paged Results) bajo AD_SEARCH_BASE.
+    Entrega el dict de atributos de cada entrada a medida que llegan las páginas.
+    """
+    tamano = int(config.get("AD_PAGE_SIZE", AD_PAGE_SIZE))
+    for entrada in buscar_paginado(conn, config["AD_SEARCH_BASE"], filtro, atributos, tamano):
+        yield entrada["attributes"]
+
+
+# Si la última lectura de AD llegó al final (la reconciliación sólo confía en lecturas completas)
+lectura_ad = {"completa": False}
+
+
+def iterar_equipos_ad(config, resolver=True):
+    """
+    Generador: lee los equipos de AD con Simple Paged Results y entrega cada
+    registro en cuanto llega su página, sin cargar todo el directorio en memoria.
+    Con resolver=False entrega los registros sin IP (la resolución la hace otra etapa).
+    """
+    total = 0
+    lectura_ad["completa"] = False
+    try:
+        with _gestor_ad(config).conexion() as conn:
+            if config.get("DNS_MODO", "socket").lower() == "ad":
+                actualizar_zona_dns(conn, config)
+            # Cada página se resuelve en bloque antes de entregarla
+            registros = (_datos_ad(atributos) for atributos in _buscar_computadoras(conn, config))
+            lotes = _en_lotes(registros, int(config.get("AD_PAGE_SIZE", AD_PAGE_SIZE)))
+            while True:
+                with medir("ad_pagina"):
+                    lote = next(lotes, None)
+                if lote is None:
+                    break
+                total += len(lote)
+                yield from (resolver_ips(lote, config) if resolver else lote)
+
+        lectura_ad["completa"] = True
+        escribir_log(f"Equipos obtenidos desde AD: {total}", tipo="INFO")
+
+    except Exception as e:
+        escribir_log(f"Excepción al leer AD (tras {total} equipos): {e}", tipo="ERROR")
+
+
+# ------------------------
+# Sincronización incremental (uSNChanged)
+# ------------------------
+# objectGUID -> registro de equipo sin IP, tal como quedó tras la última sincronización
+inventario_ad = {}
+# Marca de agua del DC: el uSNChanged es local a cada DC, por eso se guarda su invocationId
+sync_ad = {"usn": None, "invocation_id": None, "ultimo_full": 0.0}
+
+
+def _obtener_equipos_ad_delta(config):
+    """
+    Sincronización incremental: tras una lectura completa sólo se piden los
+    equipos con uSNChanged mayor a la marca guardada y se mezclan en inventario_ad.
+    Fuerza lectura completa si cambia el DC (invocationId) o cada AD_FULL_RESYNC segundos.
+    """
+    resync = int(config.get("AD_FULL_RESYNC", 3600))
+    atributos_sync = AD_ATRIBUTOS + ["objectGUID"]
+
+    try:
+        with _gestor_ad(config).conexion() as conn:
+            if config.get("DNS_MODO", "socket").lower() == "ad":
+                actualizar_zona_dns(conn, config)
+            # La marca se lee ANTES de buscar: lo que cambie durante la búsqueda se vuelve a pedir
+            usn, invocation_id = leer_marca_dc(conn)
+
+            completo = (
+                sync_ad["usn"] is None
+                or invocation_id != sync_ad["invocation_id"]
+                or time.monotonic() - sync_ad["ultimo_full"] >= resync
+            )
+
+            if completo:
+                nuevo = {}
+                for atributos in _buscar_computadoras(conn, config, atributos=atributos_sync):
+                    datos = _datos_ad(atributos)
+                    nuevo[_valor_atributo(atributos, "objectGUID")] = datos
+                inventario_ad.clear()
+                inventario_ad.update(nuevo)
+                sync_ad["ultimo_full"] = time.monotonic()
+                escribir_log(f"Sincronización completa de AD: {len(inventario_ad)} equipos (USN {usn})", tipo="INFO")
+            else:
+                filtro = f"(&(objectClass=computer)(uSNChanged>={sync_ad['usn'] + 1}))"
+                cambios = 0
+                for atributos in _buscar_computadoras(conn, config, filtro=filtro, atributos=atributos_sync):
+                    inventario_ad[_valor_atributo(atributos, "objectGUID")] = _datos_ad(atributos)
+                    cambios += 1
+                if cambios:
+                    escribir_log(f"Sincronización incremental de AD: {cambios} cambios (USN {usn})", tipo="INFO")
+
+            sync_ad["usn"] = usn
+            sync_ad["invocation_id"] = invocation_id
 
     except Exception as e:
-        escribir_log(f"Excepción al leer AD: {e}", tipo="ERROR")
+        # Se sigue trabajando con el inventario en caché; la marca no avanza
+        escribir_log(f"Excepción en sincronización incremental de AD: {e}", tipo="ERROR")
+
+    # El inventario en caché siempre es una foto completa (una lectura completa fallida no lo reemplaza)
+    lectura_ad["completa"] = bool(inventario_ad)
+    return resolver_ips(list(inventario_ad.values()), config)
 
-    return equipos
+
+def obtener_equipos_ad(config):
+    """
+    Obtiene los equipos de AD como lista.
+    Con AD_SYNC_MODO="delta" usa la sincronización incremental por uSNChanged;
+    si no, hace la lectura paginada completa.
+    """
+    with medir("ad"):
+        if config.get("AD_SYNC_MODO", "completo").lower() == "delta":
+            return _obtener_equipos_ad_delta(config)
+        return list(iterar_equipos_ad(config))
 
 # ------------------------
 # Función de ping
@@ -152,20 +301,96 @@ def obtener_equipos_ad(config):
 def hacer_ping(host):
     try:
         param = "-n" if platform.system().lower() == "windows" else "-c"
-        result = subprocess.run(["ping", param, "1", host], capture_output=True, timeout=6)
-        estado = "Activo" if result.returncode == 0 else "Inactivo"
-
-        if estado != "Activo":
-            escribir_log(f"Ping fallido: {host} → {estado}", tipo="WARNING")
-        return estado
+        with medir("ping"):
+            result = subprocess.run(["ping", param, "1", host], capture_output=True, timeout=6)
+        # Los fallos se registran como transición de estado en procesar_equipo
+        return "Activo" if result.returncode == 0 else "Inactivo"
 
     except subprocess.TimeoutExpired:
-        escribir_log(f"Ping timeout: {host}", tipo="ERROR")
+        escribir_log(f"Ping timeout: {host}", tipo="ERROR", clave="ping")
         return "Timeout"
     except Exception as e:
-        escribir_log(f"Error en ping {host}: {e}", tipo="ERROR")
+        escribir_log(f"Error en ping {host}: {e}", tipo="ERROR", clave="ping")
         return "Error"
 
+# ------------------------
+# Ping en lote (barrido ICMP)
+# ------------------------
+def sondear_lote(lote, modo_ping="icmp", ping_timeout=2, max_threads=10):
+    """
+    {nombre: (estado, rtt_ms)} de un lote: barrido ICMP si se puede,
+    si no un ping por subproceso por equipo en paralelo (sin RTT).
+    """
+    resultados = hacer_ping_lote(lote, timeout=ping_timeout) if modo_ping == "icmp" else None
+    if resultados is None:
+        with ThreadPoolExecutor(max_workers=max_threads) as executor:
+            estados = executor.map(hacer_ping, [eq["nombre"] for eq in lote])
+            resultados = {eq["nombre"]: (estado, None) for eq, estado in zip(lote, estados)}
+    return resultados
+
+
+def hacer_ping_lote(equipos, timeout=2):
+    """
+    Hace ping a todos los equipos de una vez con el barrido ICMP en proceso.
+    Devuelve {nombre: (estado, rtt_ms)} o None si no se pueden abrir sockets
+    ICMP (en ese caso se vuelve a hacer_ping por equipo).
+    """
+    try:
+        with medir("ping_lote"):
+            por_ip = barrido_icmp(_ips_ping(equipos), timeout=timeout)
+    except OSError as e:
+        escribir_log(f"Barrido ICMP no disponible, se usa ping por subproceso: {e}", tipo="WARNING")
+        return None
+
+    return _resultados_por_nombre(equipos, por_ip)
+
+
+def _ips_ping(equipos):
+    return [eq["ip"] for eq in equipos if eq.get("ip") and eq["ip"] != "No resuelve"]
+
+
+def _resultados_por_nombre(equipos, por_ip):
+    for estado, rtt in por_ip.values():
+        if rtt is not None:
+            registrar("ping_rtt", rtt / 1000)
+    return {eq["nombre"]: por_ip.get(eq.get("ip"), ("Inactivo", None)) for eq in equipos}
+
+
+def sondear_lotes(lotes, modo_ping="icmp", ping_timeout=2, max_threads=10):
+    """
+    Generador de (lote, {nombre: (estado, rtt_ms)}) para cada lote de 'lotes'
+    (lista o generador), en el mismo orden.
+    Con modo_ping="icmp" cada lote sale por un único SondeoICMP apenas llega y no
+    espera a los anteriores: los timeouts de los lotes corren superpuestos y el
+    ciclo paga ping_timeout una vez, no una por lote. Sin sockets ICMP (o con
+    "subproceso") cada lote pasa por sondear_lote.
+    """
+    sondeo = None
+    if modo_ping == "icmp":
+        try:
+            sondeo = SondeoICMP()
+        except OSError as e:
+            escribir_log(f"Barrido ICMP no disponible, se usa ping por subproceso: {e}", tipo="WARNING")
+    if sondeo is None:
+        for lote in lotes:
+            yield lote, sondear_lote(lote, "subproceso", ping_timeout, max_threads)
+        return
+
+    def terminar(lote, barrido, inicio):
+        por_ip = barrido.esperar()
+        registrar("ping_lote", time.perf_counter() - inicio)
+        return lote, _resultados_por_nombre(lote, por_ip)
+
+    en_vuelo = deque()
+    with sondeo:
+        for lote in lotes:
+            inicio = time.perf_counter()
+            en_vuelo.append((lote, sondeo.enviar(_ips_ping(lote), ping_timeout), inicio))
+            while en_vuelo and en_vuelo[0][1].listo():
+                yield terminar(*en_vuelo.popleft())
+        while en_vuelo:
+            yield terminar(*en_vuelo.popleft())
+
 # ------------------------
 # Ejecutar SQL con reintento
 # ------------------------
@@ -195,108 +420,331 @@ def ejecutar_sql_reintento(conn, query, params=(), reintentos=3, espera=5):
 sql_lock = Lock()
 
 
-def insertar_o_actualizar(conn, equipos, equipos_ad_actuales, ping_interval, max_threads=10):
+def _en_lotes(iterable, tamano):
     """
-    Inserta o actualiza los registros de AD en la base de datos.
-    Los pings se hacen en paralelo, pero las consultas SQL se serializan usando un lock.
+    Parte cualquier iterable (lista o generador) en listas de hasta 'tamano' elementos.
     """
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
 
-    def procesar_equipo(eq):
-        ping = hacer_ping(eq["nombre"])
-        estado_ad = "Dentro de AD" if eq["nombre"] in equipos_ad_actuales else "Removido de AD"
 
-        # Actualizar estado_ping
-        if eq["nombre"] in estado_ping:
-            anterior = estado_ping[eq["nombre"]]["estado"]
-            if anterior != ping:
-                escribir_log(f"Estado de {eq['nombre']} cambió de {anterior} a {ping}")
-                estado_ping[eq["nombre"]]["estado"] = ping
-                estado_ping[eq["nombre"]]["contador"] = 1
+def _lotes_ping(equipos, tamano):
+    """
+    Una lista ya leída sale en un solo barrido; un generador (AD a medida que
+    llega) se parte en lotes para sondear_lotes.
+    """
+    if isinstance(equipos, list):
+        return [equipos] if equipos else []
+    return _en_lotes(equipos, tamano)
+
+
+def actualizar_estado_equipo(eq, ping, rtt, estado_ad, ping_interval, alertas=None):
+    """
+    Aplica una muestra de ping al estado en memoria del equipo (estado_equipos):
+    registra las transiciones, avisa al ProgramadorAlertas si hay uno y
+    devuelve la fila para EquiposAD (orden de COLUMNAS_EQUIPO).
+    """
+    # Actualizar estado_equipos (sólo las transiciones van al log)
+    anterior, desde, inactivo_epoch, inactivo_antes, rearmar = estado_equipos.aplicar(eq["nombre"], ping, rtt)
+    if anterior is None:
+        if ping != "Activo":
+            escribir_log(f"Estado inicial de {eq['nombre']}: {ping}", tipo="WARNING", clave="estado")
+    elif anterior != ping:
+        escribir_log(f"Estado de {eq['nombre']} cambió de {anterior} a {ping}", clave="estado")
+
+    inactivo_desde = datetime.fromtimestamp(inactivo_epoch) if inactivo_epoch is not None else None
+    if alertas is not None:
+        if inactivo_epoch is not None and (inactivo_antes is None or rearmar):
+            alertas.marcar_inactivo(eq, inactivo_desde)
+        elif inactivo_epoch is None and inactivo_antes is not None:
+            alertas.marcar_activo(eq["nombre"])
+
+    # Calcular tiempo total en segundos: tiempo real en el estado más el intervalo de
+    # la primera muestra (ciclos saltados o atrasados no desvían la cuenta)
+    tiempo_total_segundos = int(time.time() - desde) + ping_interval
+
+    return _armar_fila(eq, ping, rtt, estado_ad, tiempo_total_segundos, inactivo_desde)
+
+
+def _armar_fila(eq, ping, rtt, estado_ad, tiempo_total_segundos, inactivo_desde):
+    """
+    Fila para EquiposAD (orden de COLUMNAS_EQUIPO) con los tiempos ya formateados.
+    """
+    # Formato viejo (HH:MM:SS) para compatibilidad
+    horas = tiempo_total_segundos // 3600
+    minutos = (tiempo_total_segundos % 3600) // 60
+    segundos = tiempo_total_segundos % 60
+    tiempo_formateado = f"{horas:02}:{minutos:02}:{segundos:02}"
+
+    # Nuevo campo ActivoTiempo (NULL si está inactivo)
+    if ping not in ("Inactivo", "Timeout", "Error"):
+        dias = tiempo_total_segundos // 86400
+        horas_activo = (tiempo_total_segundos % 86400) // 3600
+        minutos_activo = (tiempo_total_segundos % 3600) // 60
+        segundos_activo = tiempo_total_segundos % 60
+        activo_tiempo = f"{dias}d {horas_activo:02}:{minutos_activo:02}:{segundos_activo:02}"
+    else:
+        activo_tiempo = None  # Pasará como NULL a SQL Server
+
+    # Preparar fecha de inactivo para SQL Server
+    inactivo_sql = inactivo_desde
+
+    fila = (
+        eq["nombre"], eq["so"], eq["descripcion"], eq["ip"], eq["nombredns"],
+        eq["versionso"], eq["creadoel"], eq["ultimologon"], eq["responsable"],
+        eq["ubicacion"], eq["estadocuenta"], ping, tiempo_formateado,
+        inactivo_sql, estado_ad, activo_tiempo
+    )
+
+    texto_fecha = f" | Inactivo desde: {inactivo_desde}" if inactivo_desde else ""
+    texto_rtt = f" {rtt} ms" if rtt is not None else ""
+    print(f"[PING] {eq['nombre']} ({eq['ip']}) → {ping}{texto_rtt} | {estado_ad} ({tiempo_formateado}){texto_fecha}")
+
+    return fila
+
+
+# Datos de AD que, si cambian, obligan a reescribir la fila en modo vectorizado
+CAMPOS_FIRMA = ("so", "descripcion", "ip", "nombredns", "versionso", "creadoel",
+                "ultimologon", "responsable", "ubicacion", "estadocuenta")
+_datos_firma = itemgetter(*CAMPOS_FIRMA)
+
+
+def _firma(estado_ad, eq):
+    # CRC32 y no hash(): el hash de un str cambia con cada proceso (PYTHONHASHSEED)
+    # y la firma se guarda en disco con el estado
+    return zlib.crc32((estado_ad + "\x1f" + "\x1f".join(_datos_firma(eq))).encode())
+
+
+def actualizar_estados_ciclo(equipos, resultados_ping, estados_ad, ping_interval, alertas=None,
+                             heartbeat=SQL_HEARTBEAT):
+    """
+    Versión vectorizada de actualizar_estado_equipo para todas las muestras de un
+    ciclo (o de un lote del pipeline): el estado se calcula con NumPy en
+    estado_equipos.aplicar_ciclo y sólo se arman (y se imprimen) las filas que hay
+    que persistir: equipos nuevos, con cambio de estado o de datos de AD, o con el
+    latido de 'heartbeat' segundos vencido.
+    'estados_ad' es una lista alineada con 'equipos'.
+    Devuelve (filas a persistir, estados de ping del ciclo).
+    """
+    ahora = time.time()
+    muestras = [resultados_ping[eq["nombre"]] for eq in equipos]
+    estados = [ping for ping, _ in muestras]
+    firmas = [_firma(estado_ad, eq) for eq, estado_ad in zip(equipos, estados_ad)]
+
+    r = estado_equipos.aplicar_ciclo([eq["nombre"] for eq in equipos], estados, [rtt for _, rtt in muestras],
+                                     firmas=firmas, heartbeat=heartbeat, ahora=ahora)
+    if alertas is not None:
+        for i in r["rearmar"].tolist():
+            alertas.marcar_inactivo(equipos[i], datetime.fromtimestamp(float(r["inactivo_desde"][i])))
+
+    # Sólo las filas a persistir pasan a Python
+    indices = r["persistir"]
+    segundos = ((ahora - r["desde"][indices]).astype("int64") + ping_interval).tolist()
+    columnas = zip(indices.tolist(), segundos, r["cambio"][indices].tolist(), r["nuevo"][indices].tolist(),
+                   r["previo"][indices].tolist(), r["inactivo_desde"][indices].tolist(),
+                   r["inactivo_antes"][indices].tolist())
+
+    filas = []
+    for i, segundos_estado, cambio, nuevo, previo, inactivo_epoch, inactivo_antes in columnas:
+        eq, ping = equipos[i], estados[i]
+        inactivo_desde = None if math.isnan(inactivo_epoch) else datetime.fromtimestamp(inactivo_epoch)
+        if cambio:
+            if nuevo:
+                if ping != "Activo":
+                    escribir_log(f"Estado inicial de {eq['nombre']}: {ping}", tipo="WARNING", clave="estado")
             else:
-                estado_ping[eq["nombre"]]["contador"] += 1
+                anterior = estado_equipos.estados[previo]
+                escribir_log(f"Estado de {eq['nombre']} cambió de {anterior} a {ping}", clave="estado")
+
+            if alertas is not None:
+                if inactivo_desde is not None and math.isnan(inactivo_antes):
+                    alertas.marcar_inactivo(eq, inactivo_desde)
+                elif inactivo_desde is None and not math.isnan(inactivo_antes):
+                    alertas.marcar_activo(eq["nombre"])
+
+        filas.append(_armar_fila(eq, ping, muestras[i][1], estados_ad[i], segundos_estado, inactivo_desde))
+    return filas, estados
+
+
+# MERGE por equipo (modo_sql="fila")
+QUERY_MERGE_EQUIPO = """
+    MERGE EquiposAD AS target
+    USING (SELECT ? AS Nombre, ? AS SO, ? AS Descripcion, ? AS IP, ? AS NombreDNS,
+                  ? AS VersionSO, ? AS CreadoEl, ? AS UltimoLogon, ? AS Responsable,
+                  ? AS Ubicacion, ? AS EstadoCuenta, ? AS PingStatus, ? AS TiempoPing,
+                  ? AS InactivoDesde, ? AS EstadoAD, ? AS ActivoTiempo) AS src
+    ON target.Nombre = src.Nombre
+    WHEN MATCHED THEN
+        UPDATE SET target.SO = src.SO,
+                   target.Descripcion = src.Descripcion,
+                   target.IP = src.IP,
+                   target.NombreDNS = src.NombreDNS,
+                   target.VersionSO = src.VersionSO,
+                   target.CreadoEl = src.CreadoEl,
+                   target.UltimoLogon = src.UltimoLogon,
+                   target.Responsable = src.Responsable,
+                   target.Ubicacion = src.Ubicacion,
+                   target.EstadoCuenta = src.EstadoCuenta,
+                   target.PingStatus = src.PingStatus,
+                   target.TiempoPing = src.TiempoPing,
+                   target.InactivoDesde = src.InactivoDesde,
+                   target.EstadoAD = src.EstadoAD,
+                   target.ActivoTiempo = src.ActivoTiempo,
+                   target.UltimaActualizacion = GETDATE()
+    WHEN NOT MATCHED THEN
+        INSERT (Nombre, SO, Descripcion, IP, NombreDNS, VersionSO, CreadoEl,
+                UltimoLogon, Responsable, Ubicacion, EstadoCuenta, PingStatus,
+                TiempoPing, InactivoDesde, EstadoAD, ActivoTiempo)
+        VALUES (src.Nombre, src.SO, src.Descripcion, src.IP, src.NombreDNS,
+                src.VersionSO, src.CreadoEl, src.UltimoLogon, src.Responsable,
+                src.Ubicacion, src.EstadoCuenta, src.PingStatus, src.TiempoPing,
+                src.InactivoDesde, src.EstadoAD, src.ActivoTiempo);
+"""
+
+
+def insertar_o_actualizar(conn, equipos, equipos_ad_actuales, ping_interval, max_threads=10,
+                          modo_ping="icmp", ping_timeout=2, tamano_lote=AD_PAGE_SIZE, modo_sql="lote",
+                          sql_heartbeat=SQL_HEARTBEAT, escritor=None, alertas=None, vectorizado=False):
+    """
+    Inserta o actualiza los registros de AD en la base de datos.
+    'equipos' puede ser una lista o el generador de iterar_equipos_ad: una lista
+    sale en un solo barrido; un generador se procesa por lotes (sondear_lotes),
+    así los pings empiezan antes de leer la última página de AD y los timeouts
+    de los lotes se superponen.
+    Con modo_ping="icmp" los pings salen por un barrido ICMP en proceso;
+    con "subproceso" (o si no hay sockets ICMP) se lanza un ping por equipo en paralelo.
+    Con modo_sql="lote" las filas del ciclo se escriben juntas con un único MERGE
+    (upsert_equipos_lote); con "cambios" sólo se escriben las filas/columnas que
+    cambiaron, con un latido cada sql_heartbeat segundos para las demás;
+    con "fila" cada equipo hace su propio MERGE.
+    Si se pasa un EscritorSQL, las filas sólo se encolan y la escritura queda a
+    cargo de su hilo: los pings nunca esperan a la base de datos.
+    Las consultas SQL se serializan usando un lock.
+    Si se pasa un ProgramadorAlertas, cada transición a inactivo (y cada
+    recuperación) se le avisa para armar o cancelar el temporizador de la alerta.
+    Si equipos_ad_actuales es None, todos los equipos recibidos cuentan como dentro de AD.
+    Con vectorizado=True se juntan las muestras de todo el ciclo y el estado se
+    calcula en un solo paso (actualizar_estados_ciclo); sólo se escriben las filas
+    que cambiaron o cuyo latido (sql_heartbeat) venció.
+    Devuelve la cantidad de equipos procesados.
+    """
+    if equipos_ad_actuales is not None and not isinstance(equipos_ad_actuales, (set, frozenset)):
+        equipos_ad_actuales = set(equipos_ad_actuales)
+    if vectorizado:
+        return _insertar_vectorizado(conn, equipos, equipos_ad_actuales, ping_interval, max_threads,
+                                     modo_ping, ping_timeout, tamano_lote, modo_sql, sql_heartbeat,
+                                     escritor, alertas)
+
+    filas_lote = []
+    estados_ciclo = []
+
+    def procesar_equipo(eq, resultados_ping):
+        ping, rtt = resultados_ping[eq["nombre"]]
+        if equipos_ad_actuales is None or eq["nombre"] in equipos_ad_actuales:
+            estado_ad = "Dentro de AD"
         else:
-            estado_ping[eq["nombre"]] = {"estado": ping, "contador": 1}
+            estado_ad = "Removido de AD"
 
-        inactivo_desde = estado_ping[eq["nombre"]].get("inactivo_desde")
-        if ping in ("Inactivo", "Timeout", "Error"):
-            if not inactivo_desde:
-                estado_ping[eq["nombre"]]["inactivo_desde"] = datetime.now()
+        estados_ciclo.append(ping)
+        fila = actualizar_estado_equipo(eq, ping, rtt, estado_ad, ping_interval, alertas)
+
+        if escritor is not None:
+            escritor.encolar(fila)
+        elif modo_sql in ("lote", "cambios"):
+            filas_lote.append(fila)
         else:
-            estado_ping[eq["nombre"]]["inactivo_desde"] = None
+            with sql_lock, medir("sql_fila"):
+                ejecutar_sql_reintento(conn, QUERY_MERGE_EQUIPO, fila)
 
-        # Calcular tiempo total en segundos
-        tiempo_total_segundos = estado_ping[eq["nombre"]]["contador"] * ping_interval
+    # Ejecutar pings y procesar en paralelo, de a tamano_lote equipos por vez
+    procesados = 0
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        for lote, resultados_ping in sondear_lotes(_lotes_ping(equipos, tamano_lote), modo_ping,
+                                                   ping_timeout, max_threads):
+            for parte in _en_lotes(lote, tamano_lote):
+                futures = [executor.submit(procesar_equipo, eq, resultados_ping) for eq in parte]
+                for _ in as_completed(futures):
+                    pass
+            procesados += len(lote)
 
-        # Formato viejo (HH:MM:SS) para compatibilidad
-        horas = tiempo_total_segundos // 3600
-        minutos = (tiempo_total_segundos % 3600) // 60
-        segundos = tiempo_total_segundos % 60
-        tiempo_formateado = f"{horas:02}:{minutos:02}:{segundos:02}"
+    if filas_lote:
+        escribir_lote_equipos(conn, filas_lote, modo_sql, sql_heartbeat)
 
-        # Nuevo campo ActivoTiempo (NULL si está inactivo)
-        if ping not in ("Inactivo", "Timeout", "Error"):
-            dias = tiempo_total_segundos // 86400
-            horas_activo = (tiempo_total_segundos % 86400) // 3600
-            minutos_activo = (tiempo_total_segundos % 3600) // 60
-            segundos_activo = tiempo_total_segundos % 60
-            activo_tiempo = f"{dias}d {horas_activo:02}:{minutos_activo:02}:{segundos_activo:02}"
-        else:
-            activo_tiempo = None  # Pasará como NULL a SQL Server
+    registrar_resumen_ping(estados_ciclo)
+    return procesados
 
-        # Preparar fecha de inactivo para SQL Server
-        inactivo_sql = estado_ping[eq["nombre"]]["inactivo_desde"]
-        
 
-        query = """
-            MERGE EquiposAD AS target
-            USING (SELECT ? AS Nombre, ? AS SO, ? AS Descripcion, ? AS IP, ? AS NombreDNS,
-                          ? AS VersionSO, ? AS CreadoEl, ? AS UltimoLogon, ? AS Responsable,
-                          ? AS Ubicacion, ? AS EstadoCuenta, ? AS PingStatus, ? AS TiempoPing,
-                          ? AS InactivoDesde, ? AS EstadoAD, ? AS ActivoTiempo) AS src
-            ON target.Nombre = src.Nombre
-            WHEN MATCHED THEN
-                UPDATE SET target.SO = src.SO,
-                           target.Descripcion = src.Descripcion,
-                           target.IP = src.IP,
-                           target.NombreDNS = src.NombreDNS,
-                           target.VersionSO = src.VersionSO,
-                           target.CreadoEl = src.CreadoEl,
-                           target.UltimoLogon = src.UltimoLogon,
-                           target.Responsable = src.Responsable,
-                           target.Ubicacion = src.Ubicacion,
-                           target.EstadoCuenta = src.EstadoCuenta,
-                           target.PingStatus = src.PingStatus,
-                           target.TiempoPing = src.TiempoPing,
-                           target.InactivoDesde = src.InactivoDesde,
-                           target.EstadoAD = src.EstadoAD,
-                           target.ActivoTiempo = src.ActivoTiempo,
-                           target.UltimaActualizacion = GETDATE()
-            WHEN NOT MATCHED THEN
-                INSERT (Nombre, SO, Descripcion, IP, NombreDNS, VersionSO, CreadoEl,
-                        UltimoLogon, Responsable, Ubicacion, EstadoCuenta, PingStatus,
-                        TiempoPing, InactivoDesde, EstadoAD, ActivoTiempo)
-                VALUES (src.Nombre, src.SO, src.Descripcion, src.IP, src.NombreDNS,
-                        src.VersionSO, src.CreadoEl, src.UltimoLogon, src.Responsable,
-                        src.Ubicacion, src.EstadoCuenta, src.PingStatus, src.TiempoPing,
-                        src.InactivoDesde, src.EstadoAD, src.ActivoTiempo);
-        """
+def _insertar_vectorizado(conn, equipos, equipos_ad_actuales, ping_interval, max_threads, modo_ping,
+                          ping_timeout, tamano_lote, modo_sql, sql_heartbeat, escritor, alertas):
+    todos, resultados_ping = [], {}
+    for lote, resultados in sondear_lotes(_lotes_ping(equipos, tamano_lote), modo_ping, ping_timeout, max_threads):
+        resultados_ping.update(resultados)
+        todos.extend(lote)
+    if not todos:
+        return 0
 
-        with sql_lock:
-            ejecutar_sql_reintento(conn, query, (
-                eq["nombre"], eq["so"], eq["descripcion"], eq["ip"], eq["nombredns"],
-                eq["versionso"], eq["creadoel"], eq["ultimologon"], eq["responsable"],
-                eq["ubicacion"], eq["estadocuenta"], ping, tiempo_formateado,
-                inactivo_sql, estado_ad, activo_tiempo
-            ))
+    estados_ad = ["Dentro de AD" if equipos_ad_actuales is None or eq["nombre"] in equipos_ad_actuales
+                  else "Removido de AD" for eq in todos]
+    with medir("estado"):
+        filas, estados_ciclo = actualizar_estados_ciclo(todos, resultados_ping, estados_ad, ping_interval,
+                                                        alertas, heartbeat=sql_heartbeat)
+    persistir_filas(conn, filas, modo_sql, sql_heartbeat, escritor)
 
-        texto_fecha = f" | Inactivo desde: {estado_ping[eq['nombre']].get('inactivo_desde')}" if estado_ping[eq["nombre"]].get('inactivo_desde') else ""
-        print(f"[PING] {eq['nombre']} ({eq['ip']}) → {ping} | {estado_ad} ({tiempo_formateado}){texto_fecha}")
+    registrar_resumen_ping(estados_ciclo)
+    escribir_log(f"Estado vectorizado: {len(filas)} de {len(todos)} equipos para escribir", tipo="INFO")
+    return len(todos)
 
-    # Ejecutar pings en paralelo
-    with ThreadPoolExecutor(max_workers=max_threads) as executor:
-        futures = [executor.submit(procesar_equipo, eq) for eq in equipos]
-        for _ in as_completed(futures):
-            pass
+
+def persistir_filas(conn, filas, modo_sql="lote", sql_heartbeat=SQL_HEARTBEAT, escritor=None):
+    """
+    Manda las filas del modo vectorizado al EscritorSQL o las escribe en lote;
+    si la escritura falla, esos equipos vuelven a salir en el próximo ciclo.
+    """
+    if not filas:
+        return
+    if escritor is not None:
+        for fila in filas:
+            escritor.encolar(fila)
+    elif modo_sql in ("lote", "cambios"):
+        if not escribir_lote_equipos(conn, filas, modo_sql, sql_heartbeat):
+            estado_equipos.marcar_sin_escribir([fila[0] for fila in filas])
+    else:
+        for fila in filas:
+            with sql_lock, medir("sql_fila"):
+                if not ejecutar_sql_reintento(conn, QUERY_MERGE_EQUIPO, fila):
+                    estado_equipos.marcar_sin_escribir([fila[0]])
+
+
+def escribir_lote_equipos(conn, filas, modo_sql="lote", sql_heartbeat=SQL_HEARTBEAT):
+    """
+    Escribe un lote de filas con upsert_equipos_lote (o escribir_equipos_cambios
+    en modo_sql="cambios") bajo el lock de SQL.
+    """
+    with sql_lock, medir("sql_lote"):
+        if modo_sql == "cambios":
+            escrito = escribir_equipos_cambios(conn, filas, heartbeat=sql_heartbeat)
+        else:
+            escrito = upsert_equipos_lote(conn, filas)
+        if not escrito:
+            escribir_log(f"No se pudo escribir el lote de {len(filas)} equipos", tipo="ERROR")
+    return escrito
+
+
+def registrar_resumen_ping(estados):
+    """
+    Resumen del ciclo en el log en lugar de una línea por muestra.
+    """
+    conteo = Counter(estados)
+    # El gauge sale de toda la tabla en memoria: un estado que dejó de ocurrir vuelve a 0
+    for estado, n in estado_equipos.conteo_por_estado().items():
+        fijar("equipos", n, estado=estado)
+    if estados:
+        resumen = ", ".join(f"{n} {estado}" for estado, n in conteo.most_common())
+        escribir_log(f"Ping: {resumen} ({len(estados)} equipos)", tipo="INFO")
 
 '''
 def insertar_o_actualizar(conn, equipos, equipos_ad_actuales, ping_interval, max_threads=10):
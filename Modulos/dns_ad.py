@@ -0,0 +1,109 @@
+import time
+import socket
+import struct
+from threading import Lock
+from Modulos.ad_conexion import buscar_paginado, leer_marca_dc
+from Configs.logs_utils import escribir_log
+
+# ------------------------
+# Zona DNS integrada en AD
+# ------------------------
+# Cada registro DNS vive como objeto dnsNode bajo
+#   DC=<zona>,CN=MicrosoftDNS,DC=DomainDnsZones,<dominio>
+# y sus datos en el atributo binario dnsRecord (estructura DNS_RPC_RECORD).
+DNS_RECORD_CABECERA = 24      # DataLength(2) Type(2) Version(1) Rank(1) Flags(2) Serial(4) TTL(4) Reserved(4) TimeStamp(4)
+DNS_TIPO_A = 1
+DNS_AD_RESYNC = 3600          # Relectura completa de la zona cada tantos segundos
+DNS_AD_ATRIBUTOS = ["dc", "dnsRecord", "dNSTombstoned"]
+
+# nombre del host en minúsculas -> IPv4
+zona_dns = {}
+sync_zona = {"base": None, "usn": None, "invocation_id": None, "ultimo_full": 0.0}
+_zona_lock = Lock()
+
+
+def base_zona_dns(config):
+    """
+    Arma el DN de la zona a partir de AD_SEARCH_BASE (o de DNS_ZONA_AD si se configuró).
+    """
+    dominio = ",".join(p.strip() for p in config["AD_SEARCH_BASE"].split(",")
+                       if p.strip().upper().startswith("DC="))
+    zona = config.get("DNS_ZONA_AD") or ".".join(p.split("=", 1)[1] for p in dominio.split(","))
+    return f"DC={zona},CN=MicrosoftDNS,DC=DomainDnsZones,{dominio}"
+
+
+def _ip_de_registros(blobs):
+    """
+    Devuelve la primera IPv4 (registro tipo A) de una lista de blobs dnsRecord.
+    """
+    for blob in blobs or []:
+        if len(blob) < DNS_RECORD_CABECERA + 4:
+            continue
+        longitud, tipo = struct.unpack_from("<HH", blob, 0)
+        if tipo == DNS_TIPO_A and longitud == 4:
+            return socket.inet_ntoa(blob[DNS_RECORD_CABECERA:DNS_RECORD_CABECERA + 4])
+    return None
+
+
+def _texto(valores):
+    if not valores:
+        return ""
+    valor = valores[0]
+    return valor.decode("utf-8", "replace") if isinstance(valor, bytes) else str(valor)
+
+
+def actualizar_zona_dns(conn, config):
+    """
+    Lee la zona DNS de AD con una búsqueda paginada sobre la conexión del scanner.
+    La primera vez (o si cambia el DC o vence DNS_AD_RESYNC) la lee completa;
+    después sólo pide los dnsNode con uSNChanged mayor a la última marca.
+    """
+    base = base_zona_dns(config)
+    resync = int(config.get("DNS_AD_RESYNC", DNS_AD_RESYNC))
+    tamano = int(config.get("AD_PAGE_SIZE", 500))
+
+    try:
+        usn, invocation_id = leer_marca_dc(conn)
+        completo = (
+            sync_zona["usn"] is None
+            or sync_zona["base"] != base
+            or invocation_id != sync_zona["invocation_id"]
+            or time.monotonic() - sync_zona["ultimo_full"] >= resync
+        )
+
+        filtro = "(objectClass=dnsNode)"
+        if not completo:
+            filtro = f"(&(objectClass=dnsNode)(uSNChanged>={sync_zona['usn'] + 1}))"
+
+        altas, bajas = {}, []
+        for entrada in buscar_paginado(conn, base, filtro, DNS_AD_ATRIBUTOS, tamano):
+            crudos = entrada.get("raw_attributes", {})
+            nombre = _texto(crudos.get("dc")).lower()
+            if not nombre or nombre == "@" or nombre.startswith("_"):
+                continue  # Raíz de la zona y registros de servicio
+            ip = None
+            if _texto(crudos.get("dNSTombstoned")).upper() != "TRUE":
+                ip = _ip_de_registros(crudos.get("dnsRecord"))
+            if ip:
+                altas[nombre] = ip
+            else:
+                bajas.append(nombre)
+
+        with _zona_lock:
+            if completo:
+                zona_dns.clear()
+                sync_zona["ultimo_full"] = time.monotonic()
+            zona_dns.update(altas)
+            for nombre in bajas:
+                zona_dns.pop(nombre, None)
+
+        sync_zona.update(base=base, usn=usn, invocation_id=invocation_id)
+        if completo or altas or bajas:
+            tipo_lectura = "completa" if completo else "incremental"
+            escribir_log(f"Zona DNS de AD ({tipo_lectura}): {len(zona_dns)} hosts, "
+                         f"{len(altas)} altas, {len(bajas)} bajas", tipo="INFO")
+
+    except Exception as e:
+        # Se sigue con el mapa anterior; lo que falte se resuelve por DNS normal
+        escribir_log(f"No se pudo leer la zona DNS de AD ({base}): {e}", tipo="WARNING")
+
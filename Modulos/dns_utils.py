@@ -0,0 +1,102 @@
+import socket
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+# ------------------------
+# Parámetros de resolución
+# ------------------------
+DNS_TTL_POSITIVO = 300   # Segundos que se reutiliza una IP resuelta
+DNS_TTL_NEGATIVO = 60    # Segundos que se recuerda un nombre que no resuelve
+DNS_MAX_HILOS = 32
+NO_RESUELVE = "No resuelve"
+
+# nombre -> (ip, vence_en) ; ip = NO_RESUELVE para la caché negativa
+_cache_dns = {}
+_cache_lock = Lock()
+_ultima_purga = 0.0
+
+# Contadores acumulados hasta la próxima llamada a tomar_estadisticas_dns()
+estadisticas_dns = {"aciertos": 0, "aciertos_negativos": 0, "aciertos_zona": 0, "fallos": 0, "sin_resolver": 0}
+
+
+def _resolver_uno(nombre):
+    try:
+        return socket.gethostbyname(nombre)
+    except (socket.gaierror, socket.herror, UnicodeError, OSError):
+        return NO_RESUELVE
+
+
+def _purgar_vencidos(ahora):
+    """
+    Quita las entradas vencidas (equipos que ya no se consultan).
+    """
+    global _ultima_purga
+    if ahora - _ultima_purga < DNS_TTL_POSITIVO:
+        return
+    _ultima_purga = ahora
+    for nombre in [n for n, (_, vence) in _cache_dns.items() if vence <= ahora]:
+        del _cache_dns[nombre]
+
+
+# ------------------------
+# Resolución concurrente con caché
+# ------------------------
+def resolver_nombres(nombres, ttl_positivo=DNS_TTL_POSITIVO, ttl_negativo=DNS_TTL_NEGATIVO,
+                     max_hilos=DNS_MAX_HILOS, zona=None):
+    """
+    Resuelve una lista de nombres a IPv4. Si se pasa 'zona' (nombre en minúsculas -> IP,
+    p. ej. la zona DNS leída de AD) se usa primero. Lo que está vigente en la caché
+    no se vuelve a consultar; el resto se resuelve en paralelo con un pool acotado.
+    Devuelve {nombre: ip} con "No resuelve" para los que fallan.
+    """
+    ahora = time.monotonic()
+    resultado = {}
+    pendientes = []
+
+    with _cache_lock:
+        _purgar_vencidos(ahora)
+        for nombre in dict.fromkeys(nombres):
+            if zona:
+                ip = zona.get(nombre.lower())
+                if ip:
+                    resultado[nombre] = ip
+                    estadisticas_dns["aciertos_zona"] += 1
+                    continue
+            entrada = _cache_dns.get(nombre)
+            if entrada and entrada[1] > ahora:
+                resultado[nombre] = entrada[0]
+                if entrada[0] == NO_RESUELVE:
+                    estadisticas_dns["aciertos_negativos"] += 1
+                else:
+                    estadisticas_dns["aciertos"] += 1
+            else:
+                pendientes.append(nombre)
+
+    if pendientes:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_hilos, len(pendientes)))) as executor:
+            ips = list(executor.map(_resolver_uno, pendientes))
+
+        ahora = time.monotonic()
+        with _cache_lock:
+            for nombre, ip in zip(pendientes, ips):
+                ttl = ttl_negativo if ip == NO_RESUELVE else ttl_positivo
+                _cache_dns[nombre] = (ip, ahora + ttl)
+                resultado[nombre] = ip
+                estadisticas_dns["fallos"] += 1
+                if ip == NO_RESUELVE:
+                    estadisticas_dns["sin_resolver"] += 1
+
+    return resultado
+
+
+def tomar_estadisticas_dns():
+    """
+    Devuelve los contadores acumulados (aciertos/fallos de caché) y los pone en cero.
+    """
+    with _cache_lock:
+        snapshot = dict(estadisticas_dns)
+        snapshot["en_cache"] = len(_cache_dns)
+        for clave in estadisticas_dns:
+            estadisticas_dns[clave] = 0
+    return snapshot
@@ -0,0 +1,320 @@
+import os
+import time
+from threading import Lock
+import numpy as np
+
+# ------------------------
+# Estado en memoria de los equipos, en columnas
+# ------------------------
+# Cada equipo ocupa una posición (slot) fija en arreglos NumPy; el diccionario
+# sólo guarda nombre -> slot. Por equipo son ~40 bytes en lugar de un dict con
+# strings, contador y datetime.
+ESTADOS = ["Activo", "Inactivo", "Timeout", "Error"]   # Código = posición en la lista
+ESTADOS_INACTIVOS = ("Inactivo", "Timeout", "Error")
+SIN_ESTADO = -1
+ESTADO_CAPACIDAD_INICIAL = 1024
+ESTADO_CICLOS_GRACIA = 3    # Ciclos sin ver un equipo antes de liberar su slot
+ESTADO_ARCHIVO = "estado_equipos.npz"
+ESTADO_FORMATO = 1
+_COLUMNAS = ("estado", "contador", "desde", "inactivo_desde", "rtt", "visto", "firma", "escrito")
+
+
+class EstadoEquipos:
+    """
+    Tabla de estado por equipo: estado (código), contador de muestras en el estado,
+    desde (epoch del último cambio), inactivo desde (epoch o NaN), último RTT (ms o NaN),
+    el último ciclo en que se vio y, para el modo vectorizado, la firma de sus datos
+    de AD y el epoch de su última escritura. Todas las operaciones toman un único lock.
+    """
+
+    def __init__(self, capacidad=ESTADO_CAPACIDAD_INICIAL):
+        self._lock = Lock()
+        self._slots = {}       # nombre -> slot
+        self._libres = []      # slots de equipos desalojados, para reusar
+        self.estados = list(ESTADOS)
+        self._codigos = {estado: i for i, estado in enumerate(self.estados)}
+        self._inactivos = np.array([estado in ESTADOS_INACTIVOS for estado in self.estados])
+        self.ciclo = 0
+        self._reservar(capacidad)
+
+    def _reservar(self, capacidad):
+        usados = getattr(self, "_capacidad", 0)
+
+        def crecer(actual, dtype, relleno):
+            nuevo = np.full(capacidad, relleno, dtype=dtype)
+            if actual is not None:
+                nuevo[:usados] = actual[:usados]
+            return nuevo
+
+        self.estado = crecer(getattr(self, "estado", None), np.int8, SIN_ESTADO)
+        self.contador = crecer(getattr(self, "contador", None), np.uint32, 0)
+        self.desde = crecer(getattr(self, "desde", None), np.float64, 0.0)
+        self.inactivo_desde = crecer(getattr(self, "inactivo_desde", None), np.float64, np.nan)
+        self.rtt = crecer(getattr(self, "rtt", None), np.float32, np.nan)
+        self.visto = crecer(getattr(self, "visto", None), np.uint32, 0)
+        self.firma = crecer(getattr(self, "firma", None), np.int64, 0)
+        self.escrito = crecer(getattr(self, "escrito", None), np.float64, 0.0)
+        self.restaurado = crecer(getattr(self, "restaurado", None), bool, False)
+        self._capacidad = capacidad
+
+    def _codigo(self, estado):
+        codigo = self._codigos.get(estado)
+        if codigo is None:
+            # Estado desconocido: se agrega a la lista (se cuenta como inactivo)
+            codigo = self._codigos[estado] = len(self.estados)
+            self.estados.append(estado)
+            self._inactivos = np.append(self._inactivos, True)
+        return codigo
+
+    def _slot(self, nombre):
+        slot = self._slots.get(nombre)
+        if slot is None:
+            if self._libres:
+                slot = self._libres.pop()
+            else:
+                slot = len(self._slots)
+                if slot >= self._capacidad:
+                    self._reservar(self._capacidad * 2)
+            self._slots[nombre] = slot
+        return slot
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, nombre):
+        return nombre in self._slots
+
+    def _aplicar(self, nombre, estado, rtt, ahora):
+        slot = self._slot(nombre)
+        codigo = self._codigo(estado)
+        previo = int(self.estado[slot])
+        inactivo_antes = self.inactivo_desde[slot]
+        restaurado = bool(self.restaurado[slot])
+        self.restaurado[slot] = False
+
+        if previo != codigo:
+            self.estado[slot] = codigo
+            self.contador[slot] = 1
+            self.desde[slot] = ahora
+        else:
+            self.contador[slot] += 1
+        self.rtt[slot] = np.nan if rtt is None else rtt
+        self.visto[slot] = self.ciclo
+
+        if self._inactivos[codigo]:
+            if np.isnan(inactivo_antes):
+                self.inactivo_desde[slot] = ahora
+        else:
+            self.inactivo_desde[slot] = np.nan
+
+        inactivo = self.inactivo_desde[slot]
+        return (
+            self.estados[previo] if previo != SIN_ESTADO else None,
+            float(self.desde[slot]),
+            None if np.isnan(inactivo) else float(inactivo),
+            None if np.isnan(inactivo_antes) else float(inactivo_antes),
+            # Primera muestra tras un reinicio y sigue inactivo: hay que volver a armar su alerta
+            restaurado and not np.isnan(inactivo) and not np.isnan(inactivo_antes),
+        )
+
+    def aplicar(self, nombre, estado, rtt=None, ahora=None):
+        """
+        Registra una muestra de ping. Devuelve (estado anterior o None si es nuevo,
+        desde, inactivo_desde, inactivo_desde anterior, rearmar); las fechas en epoch
+        o None. 'rearmar' indica un equipo restaurado de disco que sigue inactivo:
+        conserva su InactivoDesde y su alerta se vuelve a armar, como en aplicar_ciclo().
+        """
+        with self._lock:
+            return self._aplicar(nombre, estado, rtt, time.time() if ahora is None else ahora)
+
+    def aplicar_lote(self, muestras, ahora=None):
+        """
+        Igual que aplicar() para una lista de (nombre, estado, rtt) con una sola toma del lock.
+        """
+        ahora = time.time() if ahora is None else ahora
+        with self._lock:
+            return [self._aplicar(nombre, estado, rtt, ahora) for nombre, estado, rtt in muestras]
+
+    def aplicar_ciclo(self, nombres, estados, rtts=None, firmas=None, heartbeat=None, ahora=None):
+        """
+        Versión vectorizada para todas las muestras de un ciclo (nombres sin repetir).
+        Calcula transiciones, contadores e inicio de inactividad con operaciones
+        sobre arreglos y marca qué equipos hay que persistir: nuevos, con cambio de
+        estado, con otra firma de datos de AD o con el latido ('heartbeat' seg.) vencido.
+        Devuelve un dict de arreglos alineados con 'nombres' (previo, cambio, nuevo,
+        desde, inactivo_desde, inactivo_antes), 'persistir' con los índices a escribir
+        y 'rearmar' con los equipos restaurados de disco que siguen inactivos.
+        """
+        ahora = time.time() if ahora is None else ahora
+        n = len(nombres)
+        rtts = np.array([np.nan if r is None else r for r in rtts], dtype=np.float32) if rtts is not None else np.nan
+
+        with self._lock:
+            slots = list(map(self._slots.get, nombres))
+            if None in slots:
+                slots = [self._slot(nombre) if slot is None else slot for nombre, slot in zip(nombres, slots)]
+            slots = np.array(slots, dtype=np.int64)
+            try:
+                codigos = np.array(list(map(self._codigos.__getitem__, estados)), dtype=np.int8)
+            except KeyError:
+                codigos = np.array([self._codigo(estado) for estado in estados], dtype=np.int8)
+
+            previo = self.estado[slots]
+            nuevo = previo == SIN_ESTADO
+            cambio = previo != codigos
+            desde = np.where(cambio, ahora, self.desde[slots])
+            inactivo_antes = self.inactivo_desde[slots]
+            inactivo = np.where(self._inactivos[codigos],
+                                np.where(np.isnan(inactivo_antes), ahora, inactivo_antes), np.nan)
+            # Primera muestra tras un reinicio: los que siguen inactivos rearman su alerta
+            restaurados = self.restaurado[slots]
+            rearmar = np.flatnonzero(restaurados & ~np.isnan(inactivo) & ~np.isnan(inactivo_antes))
+            if restaurados.any():
+                self.restaurado[slots] = False
+
+            self.contador[slots] = np.where(cambio, 1, self.contador[slots] + 1)
+            self.estado[slots] = codigos
+            self.desde[slots] = desde
+            self.inactivo_desde[slots] = inactivo
+            self.rtt[slots] = rtts
+            self.visto[slots] = self.ciclo
+
+            persistir = cambio.copy()
+            if firmas is not None:
+                firmas = np.asarray(firmas, dtype=np.int64)
+                persistir |= self.firma[slots] != firmas
+                self.firma[slots] = firmas
+            if heartbeat is not None:
+                persistir |= ahora - self.escrito[slots] >= heartbeat
+            escrito = np.where(persistir, ahora, self.escrito[slots])
+            if heartbeat is not None:
+                # Los nuevos reparten su primer latido en el intervalo para no coincidir todos
+                escrito = np.where(nuevo, ahora - np.random.uniform(0, heartbeat, n), escrito)
+            self.escrito[slots] = escrito
+
+        return {
+            "previo": previo, "cambio": cambio, "nuevo": nuevo, "desde": desde,
+            "inactivo_desde": inactivo, "inactivo_antes": inactivo_antes,
+            "persistir": np.flatnonzero(persistir), "rearmar": rearmar,
+        }
+
+    def marcar_sin_escribir(self, nombres):
+        """
+        Los equipos cuya escritura falló vuelven a salir en el próximo aplicar_ciclo().
+        """
+        with self._lock:
+            for nombre in nombres:
+                slot = self._slots.get(nombre)
+                if slot is not None:
+                    self.escrito[slot] = 0.0
+                    self.firma[slot] = 0
+
+    def quitar(self, nombres):
+        """
+        Libera los slots de los equipos indicados (por ejemplo, los que salieron de AD).
+        """
+        with self._lock:
+            for nombre in nombres:
+                slot = self._slots.pop(nombre, None)
+                if slot is not None:
+                    self._liberar(slot)
+
+    def _liberar(self, slot):
+        self.estado[slot] = SIN_ESTADO
+        self.contador[slot] = 0
+        self.inactivo_desde[slot] = np.nan
+        self.rtt[slot] = np.nan
+        self.firma[slot] = 0
+        self.escrito[slot] = 0.0
+        self.restaurado[slot] = False
+        self._libres.append(slot)
+
+    def cerrar_ciclo(self, gracia=ESTADO_CICLOS_GRACIA):
+        """
+        Fin de ciclo: libera los equipos que no se vieron en los últimos 'gracia'
+        ciclos (dejaron de venir de AD) y devuelve sus nombres.
+        """
+        with self._lock:
+            usados = self.estado != SIN_ESTADO
+            viejos = np.flatnonzero(usados & (self.visto.astype(np.int64) + gracia <= self.ciclo))
+            desalojados = []
+            if viejos.size:
+                por_slot = {slot: nombre for nombre, slot in self._slots.items()}
+                for slot in viejos.tolist():
+                    nombre = por_slot[slot]
+                    del self._slots[nombre]
+                    self._liberar(slot)
+                    desalojados.append(nombre)
+            self.ciclo += 1
+            return desalojados
+
+    # ------------------------
+    # Persistencia (arranque en caliente)
+    # ------------------------
+    def guardar(self, ruta=ESTADO_ARCHIVO):
+        """
+        Escribe una foto compacta de la tabla (sólo los slots en uso) en un .npz.
+        Se escribe a un temporal y se reemplaza con os.replace: un corte a mitad de
+        la escritura deja el archivo anterior intacto. Devuelve la cantidad de equipos.
+        """
+        with self._lock:
+            nombres = list(self._slots)
+            slots = np.fromiter(self._slots.values(), dtype=np.int64, count=len(nombres))
+            columnas = {c: getattr(self, c)[slots] for c in _COLUMNAS}
+            estados, ciclo = list(self.estados), self.ciclo
+
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "wb") as f:
+            np.savez(f, nombres=np.array(nombres, dtype=str), estados=np.array(estados, dtype=str),
+                     meta=np.array([ESTADO_FORMATO, ciclo, time.time()], dtype=np.float64), **columnas)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+        return len(nombres)
+
+    def cargar(self, ruta=ESTADO_ARCHIVO):
+        """
+        Reemplaza el contenido de la tabla por la foto de guardar(). Devuelve la
+        antigüedad de la foto en segundos, o None si no hay archivo o es de otro formato.
+        Cada equipo cargado queda marcado como restaurado: en su primera muestra, si
+        sigue inactivo, se vuelve a avisar al ProgramadorAlertas con su InactivoDesde original.
+        """
+        if not os.path.exists(ruta):
+            return None
+        with np.load(ruta, allow_pickle=False) as datos:
+            formato, ciclo, guardado = datos["meta"].tolist()
+            if int(formato) != ESTADO_FORMATO:
+                return None
+            nombres = datos["nombres"].tolist()
+            estados = datos["estados"].tolist()
+            columnas = {c: datos[c] for c in _COLUMNAS}
+
+        with self._lock:
+            self._capacidad = 0
+            for c in _COLUMNAS + ("restaurado",):
+                setattr(self, c, None)
+            self._reservar(max(ESTADO_CAPACIDAD_INICIAL, len(nombres) * 2))
+            for c, valores in columnas.items():
+                getattr(self, c)[:len(nombres)] = valores
+            self.restaurado[:len(nombres)] = True
+            self._slots = dict(zip(nombres, range(len(nombres))))
+            self._libres = []
+            self.estados = estados
+            self._codigos = {estado: i for i, estado in enumerate(estados)}
+            self._inactivos = np.array([estado in ESTADOS_INACTIVOS or estado not in ESTADOS for estado in estados])
+            self.ciclo = int(ciclo)
+        return time.time() - guardado
+
+    def conteo_por_estado(self):
+        """
+        {estado: cantidad de equipos} sobre toda la tabla, en una sola pasada.
+        """
+        with self._lock:
+            codigos = self.estado[self.estado != SIN_ESTADO]
+            conteo = np.bincount(codigos, minlength=len(self.estados))
+        return {estado: int(n) for estado, n in zip(self.estados, conteo)}
+
+    def bytes_por_equipo(self):
+        columnas = (self.estado, self.contador, self.desde, self.inactivo_desde, self.rtt, self.visto,
+                    self.firma, self.escrito)
+        return sum(c.itemsize for c in columnas)
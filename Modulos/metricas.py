@@ -0,0 +1,134 @@
+import time
+import random
+from bisect import bisect_left
+from threading import Lock
+from contextlib import contextmanager
+
+# ------------------------
+# Tiempos por fase del ciclo
+# ------------------------
+# Cada fase (ad, dns, ping, sql, webhook...) acumula durante el ciclo la cantidad
+# de mediciones, el total, el máximo y una muestra acotada para los percentiles.
+METRICAS_MAX_MUESTRAS = 2048   # Por fase y por ciclo (muestreo de reservorio si hay más)
+
+# Además, para el endpoint de métricas, cada fase alimenta un histograma acumulado
+# desde el arranque (límites superiores en segundos) y los contadores tienen un total
+# que no se reinicia con el ciclo.
+METRICAS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_fases = {}
+_contadores = {}
+_histogramas = {}   # fase -> {"buckets": [conteo por límite + inf], "suma", "n"}
+_totales = {}       # contador -> total desde el arranque
+_valores = {}       # (nombre, etiquetas) -> último valor (gauges)
+_metricas_lock = Lock()
+
+
+def registrar(fase, segundos):
+    """
+    Agrega una medición (en segundos) a la fase.
+    """
+    with _metricas_lock:
+        datos = _fases.get(fase)
+        if datos is None:
+            datos = _fases[fase] = {"n": 0, "total": 0.0, "max": 0.0, "muestras": []}
+        datos["n"] += 1
+        datos["total"] += segundos
+        if segundos > datos["max"]:
+            datos["max"] = segundos
+        muestras = datos["muestras"]
+        if len(muestras) < METRICAS_MAX_MUESTRAS:
+            muestras.append(segundos)
+        else:
+            i = random.randrange(datos["n"])
+            if i < METRICAS_MAX_MUESTRAS:
+                muestras[i] = segundos
+
+        hist = _histogramas.get(fase)
+        if hist is None:
+            hist = _histogramas[fase] = {"buckets": [0] * (len(METRICAS_BUCKETS) + 1), "suma": 0.0, "n": 0}
+        hist["buckets"][bisect_left(METRICAS_BUCKETS, segundos)] += 1
+        hist["suma"] += segundos
+        hist["n"] += 1
+
+
+@contextmanager
+def medir(fase):
+    """
+    with medir("dns"): ...  → registra lo que tardó el bloque (aunque falle).
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(fase, time.perf_counter() - inicio)
+
+
+def contar(nombre, cantidad=1):
+    with _metricas_lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + cantidad
+        _totales[nombre] = _totales.get(nombre, 0) + cantidad
+
+
+def fijar(nombre, valor, **etiquetas):
+    """
+    Guarda el valor actual de una medida (profundidad de cola, equipos por estado...).
+    """
+    with _metricas_lock:
+        _valores[(nombre, tuple(sorted(etiquetas.items())))] = valor
+
+
+def instantanea():
+    """
+    Copia de lo acumulado desde el arranque (histogramas, totales y valores),
+    sin reiniciar nada: es lo que publica el endpoint de métricas.
+    """
+    with _metricas_lock:
+        histogramas = {fase: {"buckets": list(h["buckets"]), "suma": h["suma"], "n": h["n"]}
+                       for fase, h in _histogramas.items()}
+        return {"histogramas": histogramas, "totales": dict(_totales), "valores": dict(_valores)}
+
+
+def _percentil(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))]
+
+
+def tomar_reporte():
+    """
+    Devuelve el resumen del ciclo y pone las fases y contadores en cero:
+    {"fases": {fase: {n, total, p50, p95, p99, max}}, "contadores": {...}}
+    """
+    with _metricas_lock:
+        fases, contadores = dict(_fases), dict(_contadores)
+        _fases.clear()
+        _contadores.clear()
+
+    reporte = {}
+    for fase, datos in fases.items():
+        ordenadas = sorted(datos["muestras"])
+        reporte[fase] = {
+            "n": datos["n"],
+            "total": datos["total"],
+            "p50": _percentil(ordenadas, 50),
+            "p95": _percentil(ordenadas, 95),
+            "p99": _percentil(ordenadas, 99),
+            "max": datos["max"],
+        }
+    return {"fases": reporte, "contadores": contadores}
+
+
+def _ms(segundos):
+    return f"{segundos * 1000:.0f}ms" if segundos < 10 else f"{segundos:.1f}s"
+
+
+def formatear_reporte(reporte):
+    """
+    Una línea compacta para el log: fase n=.. total=.. p50/p95/p99/max=..
+    """
+    partes = []
+    for fase, d in sorted(reporte["fases"].items()):
+        partes.append(f"{fase} n={d['n']} total={_ms(d['total'])} "
+                      f"p50/p95/p99/max={_ms(d['p50'])}/{_ms(d['p95'])}/{_ms(d['p99'])}/{_ms(d['max'])}")
+    partes.extend(f"{nombre}={valor}" for nombre, valor in sorted(reporte["contadores"].items()))
+    return " | ".join(partes)
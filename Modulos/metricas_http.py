@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Modulos.metricas import instantanea, METRICAS_BUCKETS
+from Configs.logs_utils import escribir_log
+
+try:
+    import psutil
+except ImportError:  # Sin psutil sólo faltan las métricas del proceso
+    psutil = None
+
+# ------------------------
+# Endpoint de métricas (formato de texto de Prometheus)
+# ------------------------
+METRICAS_PUERTO = 9108
+METRICAS_HOST = "0.0.0.0"
+PREFIJO = "adscanner"
+
+_inicio_proceso = time.time()
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    texto = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pares)
+    return "{" + texto + "}"
+
+
+def _lineas_proceso():
+    lineas = [f"# TYPE {PREFIJO}_inicio_segundos gauge",
+              f"{PREFIJO}_inicio_segundos {_inicio_proceso:.0f}"]
+    if psutil is None:
+        return lineas
+    proceso = psutil.Process(os.getpid())
+    with proceso.oneshot():
+        memoria = proceso.memory_info()
+        cpu = proceso.cpu_times()
+        hilos = proceso.num_threads()
+    lineas += [
+        f"# TYPE {PREFIJO}_proceso_memoria_bytes gauge",
+        f"{PREFIJO}_proceso_memoria_bytes{{tipo=\"rss\"}} {memoria.rss}",
+        f"{PREFIJO}_proceso_memoria_bytes{{tipo=\"vms\"}} {memoria.vms}",
+        f"# TYPE {PREFIJO}_proceso_cpu_segundos_total counter",
+        f"{PREFIJO}_proceso_cpu_segundos_total{{modo=\"usuario\"}} {cpu.user:.3f}",
+        f"{PREFIJO}_proceso_cpu_segundos_total{{modo=\"sistema\"}} {cpu.system:.3f}",
+        f"# TYPE {PREFIJO}_proceso_hilos gauge",
+        f"{PREFIJO}_proceso_hilos {hilos}",
+    ]
+    return lineas
+
+
+def generar_texto():
+    """
+    Arma la respuesta de /metrics a partir de la instantánea de Modulos.metricas:
+    - adscanner_fase_segundos (histograma por fase: ciclo, ad, dns_lote, ping_rtt, sql_lote, webhook...)
+    - adscanner_<contador>_total (equipos, dns_aciertos, webhook_ok, webhook_error...)
+    - adscanner_<valor> (equipos por estado, cola del escritor, tasa de aciertos DNS...)
+    - memoria, CPU e hilos del proceso (psutil)
+    """
+    datos = instantanea()
+    lineas = []
+
+    if datos["histogramas"]:
+        nombre = f"{PREFIJO}_fase_segundos"
+        lineas.append(f"# HELP {nombre} Duración de cada fase del escaneo.")
+        lineas.append(f"# TYPE {nombre} histogram")
+        for fase, hist in sorted(datos["histogramas"].items()):
+            acumulado = 0
+            for limite, conteo in zip(METRICAS_BUCKETS, hist["buckets"]):
+                acumulado += conteo
+                lineas.append(f'{nombre}_bucket{{fase="{fase}",le="{limite}"}} {acumulado}')
+            lineas.append(f'{nombre}_bucket{{fase="{fase}",le="+Inf"}} {hist["n"]}')
+            lineas.append(f'{nombre}_sum{{fase="{fase}"}} {hist["suma"]:.6f}')
+            lineas.append(f'{nombre}_count{{fase="{fase}"}} {hist["n"]}')
+
+    for contador, total in sorted(datos["totales"].items()):
+        lineas.append(f"# TYPE {PREFIJO}_{contador}_total counter")
+        lineas.append(f"{PREFIJO}_{contador}_total {total}")
+
+    declarados = set()
+    for (nombre, pares), valor in sorted(datos["valores"].items()):
+        if nombre not in declarados:
+            lineas.append(f"# TYPE {PREFIJO}_{nombre} gauge")
+            declarados.add(nombre)
+        lineas.append(f"{PREFIJO}_{nombre}{_etiquetas(pares)} {valor}")
+
+    try:
+        lineas += _lineas_proceso()
+    except Exception as e:
+        escribir_log(f"Métricas: no se pudieron leer los datos del proceso: {e}", tipo="WARNING", clave="metricas")
+
+    return "\n".join(lineas) + "\n"
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        cuerpo = generar_texto().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass  # Sin una línea por consulta en la consola
+
+
+def iniciar_servidor_metricas(puerto=METRICAS_PUERTO, host=METRICAS_HOST):
+    """
+    Levanta el endpoint en un hilo aparte y devuelve el servidor (o None si el puerto
+    no se pudo abrir). Las métricas se calculan sólo cuando alguien consulta /metrics.
+    """
+    try:
+        servidor = ThreadingHTTPServer((host, int(puerto)), _ManejadorMetricas)
+    except OSError as e:
+        escribir_log(f"Métricas: no se pudo abrir el puerto {puerto}: {e}", tipo="ERROR")
+        return None
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="MetricasHTTP", daemon=True).start()
+    escribir_log(f"Métricas disponibles en http://{host}:{puerto}/metrics", tipo="INFO")
+    return servidor
@@ -0,0 +1,333 @@
+import os
+import time
+import zlib
+import errno
+import socket
+import struct
+import platform
+import selectors
+import threading
+from itertools import count
+from ping3 import checksum, ICMP_HEADER_FORMAT, ICMP_TIME_FORMAT
+from ping3.enums import ICMP_DEFAULT_CODE, IcmpV4Type
+
+# ------------------------
+# Parámetros del barrido ICMP
+# ------------------------
+ICMP_PAYLOAD_BYTES = 56                 # Igual que ping3 / ping de macOS
+ICMP_BUFFER_RECEPCION = 4 * 1024 * 1024 # Buffer grande para no perder respuestas en ráfaga
+ICMP_MAX_SECUENCIAS = 0xFFFF            # Secuencias disponibles por socket
+ICMP_LOTE_ENVIO = 256                   # Paquetes enviados antes de drenar respuestas
+ICMP_ESPERA_RECEPCION = 0.05            # Máxima espera del hilo receptor entre revisiones
+
+_PAYLOAD = struct.pack(ICMP_TIME_FORMAT, 0.0) + b"Q" * (ICMP_PAYLOAD_BYTES - struct.calcsize(ICMP_TIME_FORMAT))
+
+# Identificadores ICMP: uno distinto por socket en todo el proceso, así dos
+# barridos simultáneos (hilos del pipeline) no se confunden las respuestas
+_ids_lock = threading.Lock()
+_ids = count(zlib.crc32(str(os.getpid()).encode()))
+
+
+def _nuevo_icmp_id():
+    with _ids_lock:
+        return next(_ids) & 0xFFFF
+
+
+class _CanalICMP:
+    """
+    Un socket ICMP del sondeo con su identificador y las secuencias pendientes.
+    """
+    def __init__(self):
+        self.sock = _abrir_socket_icmp()
+        # Con SOCK_DGRAM (Linux sin privilegios) no llega cabecera IP y el kernel reescribe el ID
+        self.con_cabecera_ip = (os.name != "posix") or (platform.system() == "Darwin") or (self.sock.type == socket.SOCK_RAW)
+        self.icmp_id = _nuevo_icmp_id()
+        self.id_kernel = None
+        self.registrado = False
+        self.seq = 0
+        self.pendientes = {}  # seq -> (ip, instante de envío, barrido)
+
+    def id_coincide(self, icmp_id):
+        if icmp_id == self.icmp_id:
+            return True
+        if not self.con_cabecera_ip:
+            if self.id_kernel is None:
+                try:
+                    self.id_kernel = self.sock.getsockname()[1]
+                except OSError:
+                    return False
+            return icmp_id == self.id_kernel
+        return False
+
+    def siguiente_seq(self):
+        # Si la secuencia da la vuelta con un envío aún pendiente, éste se pierde
+        # (queda "Inactivo"): hicieron falta 65535 envíos por socket en su timeout
+        self.seq = self.seq % ICMP_MAX_SECUENCIAS + 1
+        return self.seq
+
+
+def _abrir_socket_icmp():
+    """
+    Abre un socket ICMP no bloqueante: RAW si hay privilegios, si no SOCK_DGRAM.
+    Lanza OSError si el sistema no permite ninguno de los dos.
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    except PermissionError as e:
+        if e.errno != errno.EPERM:
+            raise
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+
+    sock.setblocking(False)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ICMP_BUFFER_RECEPCION)
+    except OSError:
+        pass
+    return sock
+
+
+def _construir_echo(icmp_id, seq):
+    """
+    Arma un ECHO_REQUEST con el checksum calculado por ping3.
+    """
+    cabecera = struct.pack(ICMP_HEADER_FORMAT, IcmpV4Type.ECHO_REQUEST, ICMP_DEFAULT_CODE, 0, icmp_id, seq)
+    real = checksum(cabecera + _PAYLOAD)
+    cabecera = struct.pack(ICMP_HEADER_FORMAT, IcmpV4Type.ECHO_REQUEST, ICMP_DEFAULT_CODE, socket.htons(real), icmp_id, seq)
+    return cabecera + _PAYLOAD
+
+
+def _leer_respuesta(datos, con_cabecera_ip):
+    """
+    Devuelve (es_echo_reply, icmp_id, seq, destino) o None si el paquete no nos interesa.
+    Para DESTINATION_UNREACHABLE / TIME_EXCEEDED se leen el destino, el ID y la
+    secuencia del ECHO_REQUEST original que viene embebido en el error; en un
+    ECHO_REPLY el destino es None (se compara con el origen del paquete).
+    """
+    try:
+        if con_cabecera_ip:
+            datos = datos[(datos[0] & 0x0F) * 4:]
+        tipo, _, _, icmp_id, seq = struct.unpack_from(ICMP_HEADER_FORMAT, datos)
+
+        if tipo == IcmpV4Type.ECHO_REPLY:
+            return True, icmp_id, seq, None
+
+        if tipo in (IcmpV4Type.DESTINATION_UNREACHABLE, IcmpV4Type.TIME_EXCEEDED):
+            original = datos[8:]
+            destino = socket.inet_ntoa(original[16:20])
+            original = original[(original[0] & 0x0F) * 4:]
+            tipo_orig, _, _, icmp_id, seq = struct.unpack_from(ICMP_HEADER_FORMAT, original)
+            if tipo_orig == IcmpV4Type.ECHO_REQUEST:
+                return False, icmp_id, seq, destino
+    except (IndexError, struct.error, OSError):
+        pass
+    return None
+
+
+class BarridoICMP:
+    """
+    Un grupo de destinos enviado por SondeoICMP. listo() no bloquea;
+    esperar() bloquea hasta que respondieron todos o venció su timeout
+    y devuelve {ip: (estado, rtt_ms)}.
+    """
+
+    def __init__(self, sondeo, destinos):
+        self.resultados = {ip: ("Inactivo", None) for ip in destinos}
+        self.limite = None
+        self._sondeo = sondeo
+        self._secuencias = []     # (canal, seq) de cada envío, para liberarlas al cerrar
+        self._faltan = 0
+        self._enviando = True
+        self._completo = threading.Event()
+
+    def _anotar(self, ip, resultado):
+        self.resultados[ip] = resultado
+        self._faltan -= 1
+        self._revisar()
+
+    def _revisar(self):
+        if not self._enviando and self._faltan <= 0:
+            self._completo.set()
+
+    def listo(self):
+        return self._completo.is_set() or time.perf_counter() >= self.limite
+
+    def esperar(self):
+        self._completo.wait(max(0.0, self.limite - time.perf_counter()))
+        return self._sondeo._cerrar(self)
+
+
+# ------------------------
+# Sondeo ICMP en proceso
+# ------------------------
+class SondeoICMP:
+    """
+    Unos pocos sockets ICMP compartidos y un hilo receptor que asocia cada
+    respuesta a su barrido. enviar() no espera: varios barridos pueden estar
+    en vuelo a la vez y sus timeouts corren en paralelo.
+    Lanza OSError si no se puede abrir ningún socket ICMP (sin privilegios).
+    """
+
+    def __init__(self, num_sockets=4):
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._canales = []
+        self._turno = 0
+        self._activo = True
+        self._registrado = threading.Event()
+        try:
+            for _ in range(max(1, num_sockets)):
+                self._canales.append(_CanalICMP())
+        except OSError:
+            self._cerrar_sockets()
+            raise
+        self._receptor = threading.Thread(target=self._recibir, name="SondeoICMP", daemon=True)
+        self._receptor.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def enviar(self, destinos, timeout=2):
+        """
+        Manda un ECHO_REQUEST a cada IP de 'destinos' y devuelve su BarridoICMP.
+        """
+        destinos = list(dict.fromkeys(destinos))
+        barrido = BarridoICMP(self, destinos)
+
+        for ip in destinos:
+            if self._turno % ICMP_LOTE_ENVIO == ICMP_LOTE_ENVIO - 1:
+                # En ráfaga el receptor no alcanza a vaciar los buffers: se drena también desde acá
+                for canal in self._canales:
+                    if canal.registrado:
+                        self._drenar(canal)
+            canal = self._canales[self._turno % len(self._canales)]
+            self._turno += 1
+            with self._lock:
+                seq = canal.siguiente_seq()
+                canal.pendientes[seq] = (ip, time.perf_counter(), barrido)
+                barrido._secuencias.append((canal, seq))
+                barrido._faltan += 1
+            paquete = _construir_echo(canal.icmp_id, seq)
+
+            enviado = False
+            for _ in range(2):
+                try:
+                    canal.sock.sendto(paquete, (ip, 0))
+                    enviado = True
+                    break
+                except BlockingIOError:
+                    # Buffer de envío lleno: el receptor sigue leyendo, se reintenta una vez
+                    time.sleep(0.01)
+                except OSError:
+                    break
+            if not enviado:
+                self._descartar(canal, seq, ip, barrido)
+                continue
+            if not canal.registrado:
+                # Los sockets se registran tras su primer envío (Windows exige socket ligado)
+                self._selector.register(canal.sock, selectors.EVENT_READ, data=canal)
+                canal.registrado = True
+                self._registrado.set()
+
+        with self._lock:
+            barrido.limite = time.perf_counter() + timeout
+            barrido._enviando = False
+            barrido._revisar()
+        return barrido
+
+    def _descartar(self, canal, seq, ip, barrido):
+        with self._lock:
+            if canal.pendientes.get(seq, (None, None, None))[2] is barrido:
+                del canal.pendientes[seq]
+                barrido._anotar(ip, ("Error", None))
+
+    def _cerrar(self, barrido):
+        with self._lock:
+            for canal, seq in barrido._secuencias:
+                if canal.pendientes.get(seq, (None, None, None))[2] is barrido:
+                    del canal.pendientes[seq]
+            barrido._secuencias = []
+            return dict(barrido.resultados)
+
+    def _recibir(self):
+        while self._activo:
+            if not self._registrado.wait(ICMP_ESPERA_RECEPCION):
+                continue
+            # Mientras falten sockets por registrar se revisa seguido: con select()
+            # (Windows) un socket registrado durante la espera recién se ve en la próxima
+            completo = len(self._selector.get_map()) == len(self._canales)
+            try:
+                eventos = self._selector.select(ICMP_ESPERA_RECEPCION if completo else 0.001)
+            except (OSError, ValueError):
+                # Selector cerrado o socket inválido: se reintenta hasta que cerrar() lo detenga
+                time.sleep(ICMP_ESPERA_RECEPCION)
+                continue
+            for key, _ in eventos:
+                self._drenar(key.data)
+
+    def _drenar(self, canal):
+        """
+        Lee todas las respuestas disponibles del socket y las asocia a su envío
+        por identificador, secuencia e IP (de origen en un ECHO_REPLY, del
+        paquete original embebido en un error).
+        """
+        while True:
+            try:
+                datos, origen = canal.sock.recvfrom(1500)
+            except OSError:  # Incluye BlockingIOError: no hay más por ahora
+                return
+
+            ahora = time.perf_counter()
+            leido = _leer_respuesta(datos, canal.con_cabecera_ip)
+            if not leido:
+                continue
+
+            es_reply, icmp_id, seq, destino = leido
+            if not canal.id_coincide(icmp_id):
+                continue
+
+            with self._lock:
+                pendiente = canal.pendientes.get(seq)
+                if not pendiente:
+                    continue
+                ip, enviado, barrido = pendiente
+                if (origen[0] if es_reply else destino) != ip:
+                    continue
+                del canal.pendientes[seq]
+                barrido._anotar(ip, ("Activo", round((ahora - enviado) * 1000, 2)) if es_reply
+                                else ("Inactivo", None))
+
+    def _cerrar_sockets(self):
+        self._selector.close()
+        for canal in self._canales:
+            canal.sock.close()
+
+    def cerrar(self):
+        self._activo = False
+        if self._receptor.is_alive():
+            self._receptor.join()
+        self._cerrar_sockets()
+
+
+# ------------------------
+# Barrido ICMP en proceso
+# ------------------------
+def barrido_icmp(destinos, timeout=2, num_sockets=4):
+    """
+    Envía un ECHO_REQUEST a cada IP de 'destinos' desde unos pocos sockets
+    compartidos y espera las respuestas, sin subprocesos.
+
+    Devuelve {ip: (estado, rtt_ms)} con estado "Activo", "Inactivo" o "Error".
+    Lanza OSError si no se puede abrir ningún socket ICMP (sin privilegios).
+    """
+    destinos = list(dict.fromkeys(destinos))
+    if not destinos:
+        return {}
+
+    # Cada socket tiene 65535 secuencias; se abren más si el lote lo exige
+    num_sockets = max(1, min(num_sockets, len(destinos)))
+    num_sockets = max(num_sockets, -(-len(destinos) // ICMP_MAX_SECUENCIAS))
+    with SondeoICMP(num_sockets) as sondeo:
+        return sondeo.enviar(destinos, timeout).esperar()
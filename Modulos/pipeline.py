@@ -0,0 +1,217 @@
+import time
+import queue
+import threading
+from Modulos.ad_utils import (
+    resolver_ips, sondear_lotes, actualizar_estado_equipo, actualizar_estados_ciclo, escribir_lote_equipos,
+    registrar_resumen_ping, ejecutar_sql_reintento, sql_lock, QUERY_MERGE_EQUIPO, _en_lotes, estado_equipos
+)
+from Datos.db_bulk import SQL_HEARTBEAT
+from Configs.logs_utils import escribir_log
+from Modulos.metricas import medir
+
+# ------------------------
+# Parámetros del pipeline
+# ------------------------
+PIPELINE_LOTE = 100          # Equipos por unidad de trabajo entre etapas
+PIPELINE_COLA = 4            # Lotes en espera entre dos etapas (si se llena, la anterior espera)
+PIPELINE_HILOS_DNS = 2
+PIPELINE_LOTE_SQL = 500      # Filas acumuladas por escritura en modo lote/cambios
+
+_FIN = object()
+
+
+class _Etapa:
+    """
+    Un paso del pipeline: 'hilos' trabajadores toman de 'entrada', aplican 'funcion'
+    y dejan el resultado en 'salida'. Cuando el último trabajador ve el fin de la
+    entrada, propaga el fin a la etapa siguiente.
+    """
+
+    def __init__(self, nombre, funcion, hilos, entrada, salida=None):
+        self.nombre = nombre
+        self.hilos = hilos
+        self.entrada = entrada
+        self.salida = salida
+        self.segundos = 0.0      # Tiempo ocupado, sumado entre hilos
+        self.lotes = 0
+        self._funcion = funcion
+        self._vivos = hilos
+        self._lock = threading.Lock()
+        self._trabajadores = [threading.Thread(target=self._trabajar, name=f"Pipeline-{nombre}-{i}",
+                                               daemon=True) for i in range(hilos)]
+
+    def iniciar(self):
+        for hilo in self._trabajadores:
+            hilo.start()
+        return self
+
+    def esperar(self):
+        for hilo in self._trabajadores:
+            hilo.join()
+
+    def _trabajar(self):
+        while True:
+            item = self.entrada.get()
+            if item is _FIN:
+                self.entrada.put(_FIN)  # Para los demás hilos de esta etapa
+                with self._lock:
+                    self._vivos -= 1
+                    ultimo = self._vivos == 0
+                if ultimo and self.salida is not None:
+                    self.salida.put(_FIN)
+                return
+
+            inicio = time.perf_counter()
+            try:
+                resultado = self._funcion(item)
+            except Exception as e:
+                escribir_log(f"Pipeline ({self.nombre}): error procesando un lote: {e}", tipo="ERROR")
+                resultado = None
+
+            with self._lock:
+                self.segundos += time.perf_counter() - inicio
+                self.lotes += 1
+            if resultado is not None and self.salida is not None:
+                self.salida.put(resultado)
+
+
+class _EtapaFlujo(_Etapa):
+    """
+    Etapa de un solo hilo cuya 'funcion' recibe toda la entrada como un generador
+    y devuelve un iterable de resultados, para pasos que superponen lotes
+    (el ping: sondear_lotes). 'segundos' descuenta la espera de las colas.
+    """
+
+    def __init__(self, nombre, funcion, entrada, salida=None):
+        super().__init__(nombre, funcion, 1, entrada, salida)
+        self._espera = 0.0
+
+    def _items(self):
+        while True:
+            marca = time.perf_counter()
+            item = self.entrada.get()
+            self._espera += time.perf_counter() - marca
+            if item is _FIN:
+                self.entrada.put(_FIN)
+                return
+            yield item
+
+    def _trabajar(self):
+        inicio = time.perf_counter()
+        try:
+            for resultado in self._funcion(self._items()):
+                self.lotes += 1
+                if self.salida is not None:
+                    marca = time.perf_counter()
+                    self.salida.put(resultado)
+                    self._espera += time.perf_counter() - marca
+        except Exception as e:
+            escribir_log(f"Pipeline ({self.nombre}): error procesando el flujo: {e}", tipo="ERROR")
+            for _ in self._items():
+                pass  # Se vacía la entrada para no trabar a la etapa anterior
+        self.segundos = time.perf_counter() - inicio - self._espera
+        if self.salida is not None:
+            self.salida.put(_FIN)
+
+
+# ------------------------
+# Ciclo en pipeline
+# ------------------------
+def ejecutar_pipeline(conn, config, registros, ping_interval, max_threads=10, modo_ping="icmp",
+                      ping_timeout=2, modo_sql="lote", sql_heartbeat=SQL_HEARTBEAT,
+                      escritor=None, alertas=None, vectorizado=False):
+    """
+    Procesa un ciclo como etapas concurrentes unidas por colas acotadas:
+    AD → DNS → ping → estado → SQL. Cada lote de equipos avanza en cuanto la
+    etapa anterior lo suelta, así el ciclo dura cerca de la etapa más lenta y
+    no la suma de todas. 'registros' son los equipos de AD sin IP
+    (iterar_equipos_ad(config, resolver=False)).
+    Las alertas quedan a cargo del ProgramadorAlertas (si se pasa), que recibe
+    las transiciones desde la etapa de estado.
+    Con vectorizado=True la etapa de estado calcula cada lote con NumPy
+    (actualizar_estados_ciclo) y sólo pasa a SQL las filas que cambiaron.
+    Devuelve la cantidad de equipos procesados.
+    """
+    tamano = int(config.get("PIPELINE_LOTE", PIPELINE_LOTE))
+    cola = int(config.get("PIPELINE_COLA", PIPELINE_COLA))
+    q_dns, q_ping, q_estado, q_sql = (queue.Queue(maxsize=cola) for _ in range(4))
+    estados_ciclo = []
+    pendientes_sql = []
+
+    def resolver(lote):
+        return resolver_ips(lote, config)
+
+    def sondear(lotes):
+        # Un solo sondeo ICMP para todo el ciclo: los lotes no esperan uno el timeout del otro
+        return sondear_lotes(lotes, modo_ping, ping_timeout, max_threads)
+
+    def actualizar(item):
+        # Un solo hilo: las transiciones de cada equipo se aplican en orden
+        lote, resultados = item
+        if vectorizado:
+            filas, estados = actualizar_estados_ciclo(lote, resultados, ["Dentro de AD"] * len(lote),
+                                                      ping_interval, alertas, heartbeat=sql_heartbeat)
+            estados_ciclo.extend(estados)
+            return filas
+        filas = []
+        for eq in lote:
+            ping, rtt = resultados[eq["nombre"]]
+            estados_ciclo.append(ping)
+            filas.append(actualizar_estado_equipo(eq, ping, rtt, "Dentro de AD", ping_interval, alertas))
+        return filas
+
+    def persistir(filas):
+        if escritor is not None:
+            for fila in filas:
+                escritor.encolar(fila)
+        elif modo_sql in ("lote", "cambios"):
+            pendientes_sql.extend(filas)
+            if len(pendientes_sql) >= PIPELINE_LOTE_SQL:
+                escribir_pendientes()
+        else:
+            for fila in filas:
+                with sql_lock, medir("sql_fila"):
+                    if not ejecutar_sql_reintento(conn, QUERY_MERGE_EQUIPO, fila) and vectorizado:
+                        estado_equipos.marcar_sin_escribir([fila[0]])
+
+    def escribir_pendientes():
+        if not escribir_lote_equipos(conn, pendientes_sql, modo_sql, sql_heartbeat) and vectorizado:
+            # En modo vectorizado sólo viajan las filas con cambios: si fallan, se repiten
+            estado_equipos.marcar_sin_escribir([fila[0] for fila in pendientes_sql])
+        pendientes_sql.clear()
+
+    etapas = [
+        _Etapa("DNS", resolver, int(config.get("PIPELINE_HILOS_DNS", PIPELINE_HILOS_DNS)), q_dns, q_ping),
+        _EtapaFlujo("ping", sondear, q_ping, q_estado),
+        _Etapa("estado", actualizar, 1, q_estado, q_sql),
+        _Etapa("SQL", persistir, 1, q_sql),
+    ]
+    for etapa in etapas:
+        etapa.iniciar()
+
+    # Fuente: las páginas de AD entran al pipeline a medida que llegan
+    inicio = time.perf_counter()
+    segundos_ad = 0.0
+    procesados = 0
+    lotes = _en_lotes(registros, tamano)
+    while True:
+        marca = time.perf_counter()
+        lote = next(lotes, None)
+        segundos_ad += time.perf_counter() - marca
+        if lote is None:
+            break
+        q_dns.put(lote)
+        procesados += len(lote)
+    q_dns.put(_FIN)
+
+    for etapa in etapas:
+        etapa.esperar()
+    if pendientes_sql:
+        escribir_pendientes()
+
+    registrar_resumen_ping(estados_ciclo)
+    detalle = ", ".join(f"{e.nombre} {e.segundos:.1f}s" + (f" ({e.hilos} hilos)" if e.hilos > 1 else "")
+                        for e in etapas)
+    escribir_log(f"Pipeline: {procesados} equipos en {time.perf_counter() - inicio:.1f}s | "
+                 f"ocupado: AD {segundos_ad:.1f}s, {detalle}", tipo="INFO")
+    return procesados
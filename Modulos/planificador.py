@@ -0,0 +1,66 @@
+import time
+
+# ------------------------
+# Políticas ante un ciclo que dura más que el intervalo
+# ------------------------
+#   "agrupar":   los turnos perdidos se juntan en un solo ciclo que arranca ya;
+#                después se sigue en la grilla original.
+#   "saltar":    se descartan los turnos perdidos y se espera el próximo de la grilla.
+#   "inmediato": el siguiente ciclo arranca ya y la grilla se reancla en ese instante.
+CICLO_POLITICAS = ("agrupar", "saltar", "inmediato")
+
+
+class PlanificadorCiclos:
+    """
+    Arranca los ciclos a ritmo fijo sobre el reloj monotónico (inicio + k * intervalo),
+    sin que la duración de cada ciclo se sume al período.
+    Expone el retraso del último arranque respecto de su turno y los turnos saltados.
+    """
+
+    def __init__(self, intervalo, politica="agrupar"):
+        self.intervalo = float(intervalo)
+        self.politica = politica if politica in CICLO_POLITICAS else "agrupar"
+        self._proximo = None
+        self._inicio_ciclo = None
+
+        self.ciclos = 0
+        self.retraso = 0.0            # Segundos entre el turno que tocaba y el arranque real
+        self.ciclos_saltados = 0
+        self.ultima_duracion = 0.0
+
+    def esperar_siguiente(self):
+        """
+        Bloquea hasta el turno del próximo ciclo y lo marca como iniciado.
+        La primera llamada vuelve enseguida.
+        """
+        ahora = time.monotonic()
+        if self._inicio_ciclo is not None:
+            self.ultima_duracion = ahora - self._inicio_ciclo
+
+        if self._proximo is None:
+            self._proximo = ahora
+        previsto = self._proximo
+
+        if ahora > self._proximo:
+            # El ciclo anterior se pasó de su turno
+            atrasados = int((ahora - self._proximo) // self.intervalo)
+            if self.politica == "saltar":
+                self.ciclos_saltados += atrasados + 1
+                self._proximo += (atrasados + 1) * self.intervalo
+            elif self.politica == "agrupar":
+                self.ciclos_saltados += atrasados
+                self._proximo += atrasados * self.intervalo
+            else:
+                self._proximo = ahora
+
+        espera = self._proximo - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+
+        self._inicio_ciclo = time.monotonic()
+        self.retraso = max(0.0, self._inicio_ciclo - previsto)
+        self._proximo += self.intervalo
+        self.ciclos += 1
+
+    def segundos_hasta_proximo(self):
+        return max(0.0, self._proximo - time.monotonic()) if self._proximo is not None else 0.0
@@ -0,0 +1,93 @@
+from Datos.db_conexion_extras import ejecutar_sql_fetch
+from Datos.db_bulk import marcar_removidos
+from Modulos.ad_utils import lectura_ad, estado_equipos
+from Configs.logs_utils import escribir_log
+
+# ------------------------
+# Reconciliación AD ↔ EquiposAD
+# ------------------------
+# Si una lectura deja afuera más de esta fracción del inventario se sospecha de
+# la lectura (base de búsqueda mal configurada, permisos) y no se marca nada.
+RECONCILIAR_MAX_FRACCION = 0.5
+RECONCILIAR_MIN_EQUIPOS = 20    # Por debajo de esto no se aplica el límite de fracción
+
+# Nombres que EquiposAD tiene como "Dentro de AD"; se lee de SQL una sola vez
+# y después se mantiene con las lecturas de AD de cada ciclo.
+inventario_sql = set()
+_inventario = {"cargado": False}
+
+
+def anotar_nombres(registros, nombres):
+    """
+    Generador: deja pasar los equipos de AD y va juntando sus nombres en 'nombres'
+    (para los modos que procesan AD a medida que llega).
+    """
+    for eq in registros:
+        nombres.add(eq["nombre"])
+        yield eq
+
+
+def _cargar_inventario(conn):
+    filas = ejecutar_sql_fetch(conn, """
+        SELECT Nombre FROM EquiposAD
+        WHERE EstadoAD IS NULL OR EstadoAD <> 'Removido de AD'
+    """)
+    inventario_sql.clear()
+    inventario_sql.update(nombre for (nombre,) in filas)
+    _inventario["cargado"] = True
+    escribir_log(f"Reconciliación con AD: {len(inventario_sql)} equipos en el inventario de SQL", tipo="INFO")
+
+
+def olvidar_equipos(nombres, alertas=None):
+    """
+    Quita del estado en memoria, del inventario y de los temporizadores de alerta
+    a equipos ya marcados como "Removido de AD".
+    """
+    if not nombres:
+        return
+    inventario_sql.difference_update(nombres)
+    estado_equipos.quitar(nombres)
+    if alertas is not None:
+        for nombre in nombres:
+            alertas.marcar_activo(nombre)  # Cancela el temporizador pendiente
+
+
+def reconciliar_ad(conn, nombres_ad, alertas=None, max_fraccion=RECONCILIAR_MAX_FRACCION):
+    """
+    Compara el conjunto de nombres leídos de AD en el ciclo contra el inventario
+    y marca los que desaparecieron como "Removido de AD" con un solo UPDATE.
+    Los removidos se olvidan (olvidar_equipos); como ya no vienen de AD, no se vuelven a sondear.
+    Sólo actúa si la lectura de AD del ciclo terminó completa.
+    Devuelve la lista de nombres marcados.
+    """
+    if not lectura_ad["completa"]:
+        escribir_log("Reconciliación con AD omitida: la lectura de AD no terminó", tipo="WARNING")
+        return []
+    if not _inventario["cargado"]:
+        _cargar_inventario(conn)
+
+    nombres_ad = nombres_ad if isinstance(nombres_ad, (set, frozenset)) else set(nombres_ad)
+    removidos = inventario_sql - nombres_ad
+
+    if (len(inventario_sql) >= RECONCILIAR_MIN_EQUIPOS
+            and len(removidos) > max_fraccion * len(inventario_sql)):
+        escribir_log(
+            f"Reconciliación con AD omitida: faltarían {len(removidos)} de {len(inventario_sql)} equipos "
+            f"(más del {max_fraccion:.0%}); revisar AD_SEARCH_BASE o permisos",
+            tipo="WARNING"
+        )
+        return []
+
+    if removidos and not marcar_removidos(conn, removidos):
+        escribir_log(f"No se pudieron marcar {len(removidos)} equipos removidos de AD; se reintenta en el "
+                     f"próximo ciclo", tipo="ERROR")
+        inventario_sql.update(nombres_ad)
+        return []
+
+    olvidar_equipos(removidos, alertas)
+    inventario_sql.update(nombres_ad)
+    if removidos:
+        muestra = ", ".join(sorted(removidos)[:10])
+        escribir_log(f"Removidos de AD: {len(removidos)} equipos ({muestra}{', ...' if len(removidos) > 10 else ''})",
+                     tipo="WARNING")
+    return sorted(removidos)
@@ -2,9 +2,20 @@
 import time
 from  Datos.db_conexion import conectar_sql
 from Datos.db_table import crear_tabla
-from Modulos.ad_utils import obtener_equipos_ad, insertar_o_actualizar
+from Datos.db_writer import EscritorSQL
+from Modulos.ad_utils import obtener_equipos_ad, iterar_equipos_ad, insertar_o_actualizar, estado_equipos
 from Interfaz import  gui_config
 from Configs.webhook_utils import enviar_notificacion_webhook
+from Configs.webhook_outbox import TrabajadorOutbox
+from Configs.webhook_eventos import ProgramadorAlertas
+from Configs.logs_utils import escribir_log
+from Modulos.dns_utils import tomar_estadisticas_dns
+from Modulos.planificador import PlanificadorCiclos
+from Modulos.pipeline import ejecutar_pipeline
+from Modulos.reconciliacion import reconciliar_ad, anotar_nombres, RECONCILIAR_MAX_FRACCION
+from Modulos.ad_eliminados import procesar_eliminados_ad
+from Modulos.metricas import registrar, contar, fijar, medir, tomar_reporte, formatear_reporte
+from Modulos.metricas_http import iniciar_servidor_metricas
 
 
 
@@ -13,6 +24,24 @@ from Configs.webhook_utils import enviar_notificacion_webhook
 # ------------------------
 def main(config):
     PING_INTERVAL = int(config["PING_INTERVAL"])
+    PING_MODO = config.get("PING_MODO", "icmp")            # "icmp" (barrido en proceso) o "subproceso"
+    PING_TIMEOUT = float(config.get("PING_TIMEOUT", 2))
+    SQL_MODO = config.get("SQL_MODO", "lote")             # "lote" (un MERGE por ciclo), "cambios" o "fila"
+    SQL_HEARTBEAT = int(config.get("SQL_HEARTBEAT", 300))  # Modo "cambios": latido de filas sin cambios
+    AD_STREAMING = config.get("AD_STREAMING", "no").lower() == "yes"  # Procesar cada página de AD al llegar
+    PIPELINE = config.get("PIPELINE", "no").lower() == "yes"  # Etapas AD/DNS/ping/estado/SQL concurrentes
+    SQL_ESCRITOR = config.get("SQL_ESCRITOR", "no").lower() == "yes"  # Escritura SQL en hilo propio
+    WEBHOOK_OUTBOX = config.get("WEBHOOK_OUTBOX", "no").lower() == "yes"  # Alertas vía bandeja de salida
+    ALERTAS_EVENTOS = config.get("ALERTAS_EVENTOS", "no").lower() == "yes"  # Alertas por temporizador
+    CICLO_POLITICA = config.get("CICLO_POLITICA", "agrupar")  # Ciclo más largo que el intervalo: "agrupar", "saltar" o "inmediato"
+    METRICAS = config.get("METRICAS", "no").lower() == "yes"  # Endpoint HTTP /metrics
+    ESTADO_VECTORIZADO = config.get("ESTADO_VECTORIZADO", "no").lower() == "yes"  # Estado del ciclo con NumPy, sólo filas con cambios
+    ESTADO_PERSISTIR = config.get("ESTADO_PERSISTIR", "no").lower() == "yes"  # Guardar el estado en disco para reinicios
+    ESTADO_ARCHIVO = config.get("ESTADO_ARCHIVO", "estado_equipos.npz")
+    ESTADO_GUARDAR_SEGUNDOS = int(config.get("ESTADO_GUARDAR_SEGUNDOS", 60))
+    RECONCILIAR_AD = config.get("RECONCILIAR_AD", "yes").lower() == "yes"  # Marcar los equipos que salieron de AD
+    RECONCILIAR_FRACCION = float(config.get("RECONCILIAR_MAX_FRACCION", RECONCILIAR_MAX_FRACCION))
+    AD_ELIMINADOS = config.get("AD_ELIMINADOS", "no").lower() == "yes"  # Seguir borrados vía Deleted Objects
     
     # Conectar a SQL pasando config
     conn = conectar_sql(config)
@@ -23,25 +52,164 @@ def main(config):
     # Crear la tabla si no existe
     crear_tabla(conn, config)
 
+    # Retomar contadores, tiempos e InactivoDesde de la ejecución anterior
+    ultimo_guardado = time.monotonic()
+    if ESTADO_PERSISTIR:
+        try:
+            inicio = time.perf_counter()
+            antiguedad = estado_equipos.cargar(ESTADO_ARCHIVO)
+            if antiguedad is not None:
+                escribir_log(f"Estado en memoria restaurado: {len(estado_equipos)} equipos en "
+                             f"{(time.perf_counter() - inicio) * 1000:.0f} ms (foto de hace {antiguedad:.0f}s)",
+                             tipo="INFO")
+        except Exception as e:
+            escribir_log(f"No se pudo restaurar el estado desde {ESTADO_ARCHIVO}, se arranca de cero: {e}",
+                         tipo="WARNING")
+
+    if METRICAS:
+        iniciar_servidor_metricas(config.get("METRICAS_PUERTO", 9108), config.get("METRICAS_HOST", "0.0.0.0"))
+
+    escritor = None
+    if SQL_ESCRITOR:
+        escritor = EscritorSQL(config, modo=SQL_MODO, heartbeat=SQL_HEARTBEAT).iniciar()
+
+    outbox = None
+    if WEBHOOK_OUTBOX:
+        outbox = TrabajadorOutbox(config).iniciar()
+
+    alertas = None
+    if ALERTAS_EVENTOS:
+        alertas = ProgramadorAlertas(config, outbox).iniciar()
+
+    planificador = PlanificadorCiclos(PING_INTERVAL, CICLO_POLITICA)
+
     try:
         while True:
-            # Obtener equipos de AD usando config actual
-            equipos = obtener_equipos_ad(config)
-            if not equipos:
-                print("[WARN] No se encontraron equipos en AD.")
-                time.sleep(PING_INTERVAL)
-                continue
+            # Cada ciclo arranca en su turno (ritmo fijo), no PING_INTERVAL después del anterior
+            planificador.esperar_siguiente()
+            if planificador.ciclos > 1:
+                escribir_log(
+                    f"Ciclo: duración anterior {planificador.ultima_duracion:.1f}s, "
+                    f"retraso {planificador.retraso:.1f}s, {planificador.ciclos_saltados} turnos saltados",
+                    tipo="WARNING" if planificador.retraso > 0.5 else "INFO"
+                )
+            fijar("ciclo_retraso_segundos", round(planificador.retraso, 3))
+            fijar("ciclos_saltados", planificador.ciclos_saltados)
+            inicio_ciclo = time.perf_counter()
+            nombres_ad = set()
 
-            equipos_ad_actuales = [eq["nombre"] for eq in equipos]
+            if PIPELINE:
+                # Cada lote avanza por DNS → ping → estado → SQL sin esperar al resto
+                procesados = ejecutar_pipeline(conn, config,
+                                               anotar_nombres(iterar_equipos_ad(config, resolver=False), nombres_ad),
+                                               ping_interval=PING_INTERVAL,
+                                               modo_ping=PING_MODO, ping_timeout=PING_TIMEOUT,
+                                               modo_sql=SQL_MODO, sql_heartbeat=SQL_HEARTBEAT,
+                                               escritor=escritor, alertas=alertas,
+                                               vectorizado=ESTADO_VECTORIZADO)
+                contar("equipos", procesados)
+                if not procesados:
+                    print("[WARN] No se encontraron equipos en AD.")
+                    continue
+            elif AD_STREAMING:
+                # Las páginas de AD pasan directo a ping/SQL a medida que llegan
+                procesados = insertar_o_actualizar(conn, anotar_nombres(iterar_equipos_ad(config), nombres_ad), None,
+                                                   ping_interval=PING_INTERVAL,
+                                                   modo_ping=PING_MODO, ping_timeout=PING_TIMEOUT,
+                                                   modo_sql=SQL_MODO, sql_heartbeat=SQL_HEARTBEAT,
+                                                   escritor=escritor, alertas=alertas,
+                                                   vectorizado=ESTADO_VECTORIZADO)
+                contar("equipos", procesados)
+                if not procesados:
+                    print("[WARN] No se encontraron equipos en AD.")
+                    continue
+            else:
+                # Obtener equipos de AD usando config actual
+                equipos = obtener_equipos_ad(config)
+                contar("equipos", len(equipos))
+                if not equipos:
+                    print("[WARN] No se encontraron equipos en AD.")
+                    continue
 
-            # Insertar o actualizar equipos en DB usando ping
-            insertar_o_actualizar(conn, equipos, equipos_ad_actuales, ping_interval=PING_INTERVAL)
-            
-            enviar_notificacion_webhook(conn)
+                equipos_ad_actuales = nombres_ad = {eq["nombre"] for eq in equipos}
 
+                # Insertar o actualizar equipos en DB usando ping
+                insertar_o_actualizar(conn, equipos, equipos_ad_actuales, ping_interval=PING_INTERVAL,
+                                      modo_ping=PING_MODO, ping_timeout=PING_TIMEOUT,
+                                      modo_sql=SQL_MODO, sql_heartbeat=SQL_HEARTBEAT,
+                                      escritor=escritor, alertas=alertas,
+                                      vectorizado=ESTADO_VECTORIZADO)
             
-            print(f"[INFO] Actualización completada. Esperando {PING_INTERVAL} segundos...\n")
-            time.sleep(PING_INTERVAL)
+            if AD_ELIMINADOS:
+                # Una consulta chica por ciclo a CN=Deleted Objects (uSNChanged incremental)
+                with medir("ad_eliminados"):
+                    eliminados = procesar_eliminados_ad(conn, config, alertas)
+                contar("eliminados_ad", len(eliminados))
+
+            if RECONCILIAR_AD:
+                # Los que estaban en EquiposAD y ya no vienen de AD
+                with medir("reconciliacion"):
+                    removidos = reconciliar_ad(conn, nombres_ad, alertas, RECONCILIAR_FRACCION)
+                contar("removidos_ad", len(removidos))
+
+            dns = tomar_estadisticas_dns()
+            escribir_log(
+                f"DNS: {dns['aciertos']} aciertos, {dns['aciertos_negativos']} aciertos negativos, "
+                f"{dns['aciertos_zona']} desde la zona de AD, "
+                f"{dns['fallos']} consultas ({dns['sin_resolver']} sin resolver), {dns['en_cache']} en caché",
+                tipo="INFO"
+            )
+            contar("dns_aciertos", dns["aciertos"] + dns["aciertos_negativos"] + dns["aciertos_zona"])
+            contar("dns_fallos", dns["fallos"])  # Consultas fuera de caché
+            consultas_dns = dns["aciertos"] + dns["aciertos_negativos"] + dns["aciertos_zona"] + dns["fallos"]
+            if consultas_dns:
+                fijar("dns_tasa_aciertos", round(1 - dns["fallos"] / consultas_dns, 4))
+            fijar("dns_en_cache", dns["en_cache"])
+
+            if escritor:
+                fijar("escritor_cola", escritor.profundidad())
+                fijar("escritor_descartadas", escritor.filas_descartadas)
+                escribir_log(
+                    f"Escritor SQL: {escritor.profundidad()} filas en cola, {escritor.filas_escritas} escritas "
+                    f"en {escritor.lotes} lotes, {escritor.filas_descartadas} descartadas",
+                    tipo="INFO"
+                )
+
+            if outbox:
+                escribir_log(
+                    f"Outbox de alertas: {outbox.enviadas} entregadas, {outbox.reintentos} reintentos, "
+                    f"{outbox.muertas} descartadas",
+                    tipo="INFO"
+                )
+
+            if alertas:
+                escribir_log(
+                    f"Alertas por eventos: {alertas.pendientes()} equipos inactivos con temporizador, "
+                    f"{alertas.disparadas} alertas disparadas",
+                    tipo="INFO"
+                )
+            else:
+                enviar_notificacion_webhook(conn, outbox)
+
+            # Liberar el estado en memoria de los equipos que ya no vienen de AD
+            desalojados = estado_equipos.cerrar_ciclo()
+            if desalojados:
+                if alertas:
+                    alertas.cancelar(desalojados)  # Sin esto, con RECONCILIAR_AD=no seguirían alertando
+                escribir_log(f"Estado en memoria: {len(desalojados)} equipos sin ver en varios ciclos liberados "
+                             f"({len(estado_equipos)} en memoria)", tipo="INFO")
+            fijar("equipos_en_memoria", len(estado_equipos))
+
+            if ESTADO_PERSISTIR and time.monotonic() - ultimo_guardado >= ESTADO_GUARDAR_SEGUNDOS:
+                guardar_estado(ESTADO_ARCHIVO)
+                ultimo_guardado = time.monotonic()
+
+            # Tiempos por fase de este ciclo (los ciclos sin equipos se suman al siguiente)
+            registrar("ciclo", time.perf_counter() - inicio_ciclo)
+            escribir_log("Fases: " + formatear_reporte(tomar_reporte()), tipo="INFO")
+
+            print(f"[INFO] Actualización completada. Próximo ciclo en "
+                  f"{planificador.segundos_hasta_proximo():.0f} segundos...\n")
 
     except KeyboardInterrupt:
         print("\n[INFO] Script detenido manualmente.")
@@ -49,6 +217,28 @@ def main(config):
     except Exception as e:
         print("[ERROR] Ocurrió un error inesperado:", e)
 
+    finally:
+        if ESTADO_PERSISTIR:
+            guardar_estado(ESTADO_ARCHIVO)
+        if escritor:
+            print("[INFO] Escribiendo filas pendientes...")
+            escritor.detener()
+        if alertas:
+            alertas.detener()
+        if outbox:
+            outbox.detener()
+
+
+def guardar_estado(ruta):
+    """
+    Foto del estado en memoria en disco; un error sólo se registra.
+    """
+    try:
+        with medir("estado_guardar"):
+            estado_equipos.guardar(ruta)
+    except Exception as e:
+        escribir_log(f"No se pudo guardar el estado en {ruta}: {e}", tipo="ERROR")
+
 
 # ------------------------
 # INICIO DEL PROGRAMA